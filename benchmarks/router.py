@@ -0,0 +1,75 @@
+""" compare the routing tree used by `yawf.router.Router` against a linear scan
+over the compiled route regexes, which is how routes used to be resolved.
+
+::
+
+    $ python benchmarks/router.py --routes 300
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yawf.router import Router  # noqa
+
+
+def build_router(count):
+    router = Router()
+    handler = lambda ws, **kwargs: None  # noqa
+    for i in range(count):
+        if i % 3 == 0:
+            router.route("/static{}/page".format(i))(handler)
+        elif i % 3 == 1:
+            router.route("/api{}/{{obj}}/{{pk:[0-9]+}}/".format(i))(handler)
+        else:
+            router.route("/feature{}/{{name}}/detail".format(i))(handler)
+    return router
+
+
+def linear_resolve(router, path):
+    for regex, handler in router.routes.values():
+        match = regex.match(path)
+        if match is not None:
+            return match.groupdict(), handler
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--number", type=int, default=20000)
+    options = parser.parse_args(argv)
+
+    router = build_router(options.routes)
+    last = options.routes - 1
+    paths = {
+        "first": "/static0/page",
+        "static": "/static{}/page/".format(last - last % 3),
+        "dynamic": "/api{}/racoons/99/".format(last - (last - 1) % 3),
+        "missing": "/nothing/to/see/here",
+        }
+
+    print("{0} routes, {1} lookups per path\n".format(
+        options.routes, options.number))
+    print("{0:<10} {1:>12} {2:>12}".format("path", "regex (us)", "router (us)"))
+    for name, path in paths.items():
+        expected = linear_resolve(router, path)
+        match = router._match(path)
+        if match is not None:
+            kwargs, route = match
+            match = kwargs, route.handler
+        assert match == expected, path
+        regex = timeit.timeit(lambda: linear_resolve(router, path),
+                              number=options.number)
+        tree = timeit.timeit(lambda: router._match(path),
+                             number=options.number)
+        print("{0:<10} {1:>12.2f} {2:>12.2f}".format(
+            name,
+            regex / options.number * 1e6,
+            tree / options.number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
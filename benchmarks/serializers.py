@@ -0,0 +1,63 @@
+""" compare the serializer backends in `yawf.serializers` on the shapes of the
+messages our handlers send and receive.
+
+::
+
+    $ python benchmarks/serializers.py --number 20000
+"""
+import argparse
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yawf.serializers import get_serializer  # noqa
+
+NOW = datetime.datetime(2015, 11, 7, 12, 4, 8, 123456)
+
+MESSAGES = {
+    "chat": {"handle": "megaman", "message": "hello, world!"},
+    "auth": {"foo": "bar", "authentication": "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1"
+             "NiJ9.eyJ1c2VybmFtZSI6Im1lZ2FtYW4iLCJwayI6OX0.abcdefghijklmnop"},
+    "event": {"type": "update", "sent": NOW, "payload": b"raw bytes",
+              "tags": ["a", "b", "c"]},
+    "batch": {"rows": [{"id": i, "name": "row{}".format(i), "at": NOW,
+                        "score": i * 0.5} for i in range(50)]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("backends", nargs="*",
+                        default=["json", "ujson", "orjson"])
+    options = parser.parse_args(argv)
+
+    serializers = []
+    for name in options.backends:
+        try:
+            serializers.append(get_serializer(name))
+        except ImportError:
+            print("{} is not installed, skipping".format(name))
+
+    print("{0} round trips per message, microseconds per call\n".format(
+        options.number))
+    print("{0:<8} {1:<8} {2:>10} {3:>10}".format(
+        "message", "backend", "dumps", "loads"))
+    for label, message in MESSAGES.items():
+        for serializer in serializers:
+            dumped = serializer.dumps(message)
+            dumps = timeit.timeit(lambda: serializer.dumps(message),
+                                  number=options.number)
+            loads = timeit.timeit(lambda: serializer.loads(dumped),
+                                  number=options.number)
+            print("{0:<8} {1:<8} {2:>10.2f} {3:>10.2f}".format(
+                label, serializer.name,
+                dumps / options.number * 1e6,
+                loads / options.number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
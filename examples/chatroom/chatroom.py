@@ -33,18 +33,7 @@ class Chatroom(BaseHandler):
             app.logger.debug("recieved `{}` from client".format(value))
             app.logger.debug("distributing message to {}"
                                 " clients".format(len(self.websockets)))
-            yield from self.distribute_message(value)
+            yield from self.broadcast(value)
         app.logger.debug("closing the websocket now.")
 
-    @asyncio.coroutine
-    def distribute_message(self, message):
-        websockets = list(self.websockets)
-        for ws in websockets:
-            if ws.open:
-                app.logger.debug("sending message to {}".format(ws))
-                yield from self.send_json(ws, message)
-            else:
-                app.logger.debug("websocket was closed, removing client")
-                self.remove_websocket(ws)
-
 app.run("localhost", 8765, debug=True)
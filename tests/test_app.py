@@ -1,10 +1,15 @@
 import asyncio
+import os
+import signal
+import time
 from unittest import mock
 
 import pytest
 
 from yawf import App, BaseHandler
-from yawf.router import RouterResolutionError
+from yawf.compatibility import ensure_future
+from yawf.conf import patch_settings
+from yawf.router import Router, RouterResolutionError
 
 
 @pytest.fixture
@@ -25,10 +30,15 @@ def mock_socket():
     def close(*args, **kwargs):
         return
 
+    @asyncio.coroutine
+    def bind_pipeline(pipeline, *, query=None):
+        return
+
     mock_socket = mock.Mock(
         recv=mock.Mock(wraps=recv),
         send=mock.Mock(wraps=send),
-        close=mock.Mock(wraps=close)
+        close=mock.Mock(wraps=close),
+        bind_pipeline=mock.Mock(wraps=bind_pipeline)
         )
     return mock_socket
 
@@ -114,8 +124,7 @@ def test_application_as_handler_unknown_route(evloop, mock_socket):
     def run_handler():
         yield from handler(mock_socket, "/echo")
         assert mock_socket.close.called
-        error = "could not resolve the path /echo tried "\
-                "{}".format(list(app.router.routes.keys()))
+        error = "could not resolve the path /echo"
         mock_socket.close.assert_called_with(code=1011, reason=error)
 
     evloop.run_until_complete(run_handler())
@@ -134,3 +143,318 @@ def test_run_app_debug(evloop, mock_loop):
     app.run("localhost", 8765, debug=True, loop=mock_loop)
     assert app.logger.level == 10  # debug
     assert app.debug is True
+
+
+def test_application_binds_route_pipeline(evloop, mock_socket):
+    app = App(name="testapp")
+
+    @app.route("/telemetry", middleware=[])
+    @asyncio.coroutine
+    def telemetry(ws, **kwargs):
+        pass
+
+    app.reload_middleware()
+    handler = app.as_handler(loop=evloop)
+    evloop.run_until_complete(handler(mock_socket, "/telemetry"))
+    mock_socket.bind_pipeline.assert_called_with(app.pipeline_for(()), query={})
+    assert mock_socket.pipeline.close.called
+
+
+class DrainSocket:
+    def __init__(self):
+        self.open = True
+        self.closed_with = None
+        self.pipeline = None
+        self._closed = asyncio.Future()
+
+    @asyncio.coroutine
+    def bind_pipeline(self, pipeline, *, query=None):
+        self.pipeline = pipeline.bind(self)
+        yield from self.pipeline.open(query=query)
+
+    @asyncio.coroutine
+    def recv(self):
+        yield from asyncio.shield(self._closed)
+
+    @asyncio.coroutine
+    def close(self, code=1000, reason=""):
+        if self.open:
+            self.open = False
+            self.closed_with = code
+            self._closed.set_result(None)
+
+
+@patch_settings(middleware=[])
+def test_shutdown_drains_connections(evloop):
+    app = App(name="testapp")
+    finished = []
+
+    @app.route("/drain")
+    @asyncio.coroutine
+    def polite(ws, **kwargs):
+        yield from ws.recv()
+        finished.append(ws)
+
+    @app.route("/stubborn")
+    @asyncio.coroutine
+    def stubborn(ws, **kwargs):
+        yield from asyncio.sleep(60)
+
+    handler = app.as_handler(loop=evloop)
+    one, two = DrainSocket(), DrainSocket()
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(one, "/drain")),
+                 ensure_future(handler(two, "/stubborn"))]
+        yield from asyncio.sleep(0.01)
+        assert len(app._connections) == 2
+        yield from app.shutdown(timeout=0.1)
+        assert all(task.done() for task in tasks)
+        assert tasks[1].cancelled()
+
+        late = DrainSocket()
+        app.draining = True
+        yield from handler(late, "/drain")
+        app.draining = False
+        assert late.closed_with == 1001
+
+    evloop.run_until_complete(go())
+    assert finished == [one]
+    assert one.closed_with == two.closed_with == 1001
+    assert app._connections == {}
+
+
+@patch_settings(middleware=[], handoff_stagger=0.2)
+def test_handoff_staggers_the_drain(evloop):
+    app = App(name="testapp")
+    events = []
+
+    @app.route("/drain")
+    @asyncio.coroutine
+    def polite(ws, **kwargs):
+        yield from ws.recv()
+        events.append(("closed", evloop.time()))
+
+    class Listening:
+        def close(self):
+            events.append(("listening", evloop.time()))
+
+    class Server:
+        server = Listening()
+
+        def close(self):
+            events.append(("server", evloop.time()))
+
+        @asyncio.coroutine
+        def wait_closed(self):
+            pass
+
+    handler = app.as_handler(loop=evloop)
+    sockets = [DrainSocket() for _ in range(4)]
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(ws, "/drain")) for ws in sockets]
+        yield from asyncio.sleep(0.01)
+        yield from app.shutdown(Server(), timeout=1, handoff=True)
+        assert all(task.done() for task in tasks)
+
+    evloop.run_until_complete(go())
+    names = [name for name, _ in events]
+    assert names == ["listening"] + ["closed"] * 4 + ["server"]
+    closes = [at for name, at in events if name == "closed"]
+    assert closes[-1] - closes[0] >= 0.1
+    assert all(ws.closed_with == 1001 for ws in sockets)
+
+
+@patch_settings(middleware=[], max_connections=3,
+                max_connections_per_route={"/limited": 1})
+def test_admission_limits(evloop):
+    app = App(name="testapp")
+
+    @app.route("/limited")
+    @app.route("/open")
+    @asyncio.coroutine
+    def waiter(ws, **kwargs):
+        yield from ws.recv()
+
+    handler = app.as_handler(loop=evloop)
+    sockets = [DrainSocket() for _ in range(5)]
+    paths = ["/limited", "/limited", "/open", "/open", "/open"]
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(ws, path))
+                 for ws, path in zip(sockets, paths)]
+        yield from asyncio.sleep(0.01)
+        counts = app.connection_counts()
+        assert counts["total"] == 3
+        assert counts["routes"] == {"/limited": 1, "/open": 2}
+        assert counts["rejected"] == 2
+        assert counts["lag_rejected"] == 0
+        assert sockets[1].closed_with == 1013
+        assert sockets[4].closed_with == 1013
+
+        for ws in sockets:
+            yield from ws.close()
+        yield from asyncio.wait(tasks)
+        assert app.connection_counts()["total"] == 0
+        assert app.connection_counts()["routes"] == {}
+
+    app._rejected = app._lag_rejected = 0
+    evloop.run_until_complete(go())
+
+
+@patch_settings(middleware=[], max_connections=None,
+                max_connections_per_route=None)
+def test_lag_sheds_lowest_priority(evloop):
+    app = App(name="testapp")
+
+    @asyncio.coroutine
+    def waiter(ws, **kwargs):
+        yield from ws.recv()
+
+    @asyncio.coroutine
+    def important(ws, **kwargs):
+        yield from ws.recv()
+    important.priority = 10
+
+    app.route("/bulk")(waiter)
+    app.route("/important")(important)
+    handler = app.as_handler(loop=evloop)
+    first, second, vip, late = (DrainSocket() for _ in range(4))
+    app._rejected = app._lag_rejected = 0
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(first, "/bulk")),
+                 ensure_future(handler(vip, "/important")),
+                 ensure_future(handler(second, "/bulk"))]
+        yield from asyncio.sleep(0.01)
+        monitor = app.start_monitor(loop=evloop)
+        monitor.stop()
+        monitor.reject_above = monitor.shed_above = 0.1
+        monitor.lag = 0.2
+        assert app.shed(2) == [second, first]
+        assert app.shed(2) == [vip]
+        yield from handler(late, "/bulk")
+        assert late.closed_with == 1013
+        counts = app.connection_counts()
+        assert counts["rejected"] == 0
+        assert counts["lag_rejected"] == 1
+        yield from asyncio.wait(tasks)
+        app.stop_monitor()
+
+    evloop.run_until_complete(go())
+    assert first.closed_with == second.closed_with == vip.closed_with == 1013
+
+
+@patch_settings(middleware=[], max_connections=None,
+                max_connections_per_route={"/a/": 1})
+def test_admission_limits_mounted_routes(evloop):
+    app = App(name="testapp")
+    a, b = Router(), Router()
+
+    @asyncio.coroutine
+    def waiter(ws, **kwargs):
+        yield from ws.recv()
+
+    a.route("/")(waiter)
+    b.route("/")(waiter)
+    app.mount("/a", a)
+    app.mount("/b", b)
+    handler = app.as_handler(loop=evloop)
+    sockets = [DrainSocket() for _ in range(3)]
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(ws, path)) for ws, path
+                 in zip(sockets, ["/a", "/b", "/a/"])]
+        yield from asyncio.sleep(0.01)
+        assert app.connection_counts()["routes"] == {"/a/": 1, "/b/": 1}
+        assert sockets[2].closed_with == 1013
+        for ws in sockets:
+            yield from ws.close()
+        yield from asyncio.wait(tasks)
+
+    evloop.run_until_complete(go())
+
+
+@patch_settings(middleware=[], max_connections=None,
+                max_connections_per_route=None)
+def test_lag_sheds_by_handler_class_priority(evloop):
+    app = App(name="testapp")
+
+    @app.route("/vip")
+    class Important(BaseHandler):
+        priority = 10
+
+        @asyncio.coroutine
+        def handle(self, ws, **kwargs):
+            yield from ws.recv()
+
+    @app.route("/bulk", priority=-1)
+    @asyncio.coroutine
+    def bulk(ws, **kwargs):
+        yield from ws.recv()
+
+    assert app.router.lookup("/vip")[1].priority == 10
+    handler = app.as_handler(loop=evloop)
+    vip, cheap = DrainSocket(), DrainSocket()
+
+    @asyncio.coroutine
+    def go():
+        tasks = [ensure_future(handler(cheap, "/bulk")),
+                 ensure_future(handler(vip, "/vip"))]
+        yield from asyncio.sleep(0.01)
+        assert app.shed(1) == [cheap]
+        assert app.shed(1) == [vip]
+        yield from asyncio.wait(tasks)
+
+    evloop.run_until_complete(go())
+
+
+class FakeListener:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+    @asyncio.coroutine
+    def wait_closed(self):
+        pass
+
+
+@patch_settings(middleware=[], shutdown_timeout=30, lag_reject_threshold=None,
+                lag_shed_threshold=None)
+def test_second_signal_skips_the_drain():
+    app = App(name="testapp")
+    loop = asyncio.new_event_loop()
+    listener = FakeListener()
+    stubborn = DrainSocket()
+
+    @asyncio.coroutine
+    def server():
+        return listener
+
+    @asyncio.coroutine
+    def hang():
+        yield from asyncio.sleep(60)
+
+    def first():
+        app._connections[stubborn] = ensure_future(hang(), loop=loop)
+        os.kill(os.getpid(), signal.SIGINT)
+        loop.call_later(0.05, os.kill, os.getpid(), signal.SIGINT)
+
+    loop.call_soon(first)
+    started = time.monotonic()
+    try:
+        app._serve_forever(loop, server())
+    finally:
+        app._connections.clear()
+    assert time.monotonic() - started < 10
+    assert listener.closed
+    assert stubborn.closed_with == 1001
+    assert loop.is_closed()
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
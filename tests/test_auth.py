@@ -1,4 +1,7 @@
+import asyncio
 from datetime import datetime, timedelta
+import time
+from unittest import mock
 
 import pytest
 
@@ -50,3 +53,93 @@ def test_refreshing_token(gen):
     validate = gen.validate(token)
     assert cached["iat"] <= validated["iat"]
     assert cached["exp"] <= validated["exp"]
+
+@patch_settings(secret_key="okay", token_valid_duration=timedelta(minutes=2))
+def test_validated_tokens_are_cached(gen):
+    token = gen.create(username="fred", pk=9)
+    gen.clear_cache()
+    with mock.patch("jwt.decode", wraps=jwt.decode) as decode:
+        first = gen.validate(token)
+        first["username"] = "changed"
+        second = gen.validate(token)
+        assert decode.call_count == 1
+    assert second["username"] == "fred"
+
+
+@patch_settings(secret_key="okay", token_valid_duration=timedelta(minutes=2))
+def test_token_cache_expires_entries(gen):
+    token = gen.create(username="fred", pk=9)
+    gen.clear_cache()
+    exp = gen.validate(token)["exp"]
+    assert len(gen._cache) == 1
+
+    with mock.patch("time.time", return_value=exp + 1):
+        gen._expire(time.time())
+    assert len(gen._cache) == 0
+
+
+@patch_settings(secret_key="okay", token_valid_duration=timedelta(minutes=2))
+def test_token_cache_expiry_heap_is_bounded(gen):
+    gen.clear_cache()
+    tokens = [gen.create(username="fred", pk=pk) for pk in range(12)]
+    with mock.patch.object(type(gen), "cache_size", 2):
+        for _ in range(3):
+            for token in tokens:
+                gen.validate(token)
+        assert len(gen._cache) == 2
+        assert len(gen._expiry) <= 4
+        assert set(gen._expiry) >= set(
+            (exp, digest) for digest, (_, exp) in gen._cache.items())
+    gen.clear_cache()
+
+
+def test_token_cache_cleared_with_secret_key(gen):
+    @patch_settings(secret_key="okay")
+    def validate_with_okay(token):
+        return gen.validate(token)
+
+    @patch_settings(secret_key="other")
+    def validate_with_other(token):
+        return gen.validate(token)
+
+    token = patch_settings(secret_key="okay")(gen.create)(username="fred", pk=9)
+    assert validate_with_okay(token)["username"] == "fred"
+    with pytest.raises(jwt.DecodeError):
+        validate_with_other(token)
+
+
+@patch_settings(secret_key="okay", token_valid_duration=timedelta(minutes=2))
+def test_async_token_methods_use_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    gen = auth.JWTTokenAuth(executor=executor)
+    gen.clear_cache()
+    loop = asyncio.get_event_loop()
+
+    with mock.patch.object(executor, "submit", wraps=executor.submit) as submit:
+        token = loop.run_until_complete(gen.acreate(username="fred", pk=9))
+        validated = loop.run_until_complete(gen.avalidate(token))
+        assert validated["username"] == "fred"
+        assert submit.call_count == 2
+
+        loop.run_until_complete(gen.avalidate(token))  # cached
+        assert submit.call_count == 2
+
+        token = loop.run_until_complete(gen.arefresh(token))
+        assert gen.validate(token)["pk"] == 9
+    executor.shutdown()
+
+
+@patch_settings(secret_key="okay", token_valid_duration=timedelta(minutes=2))
+def test_revoked_token(gen):
+    token = gen.create(username="fred", pk=9)
+    validated = gen.validate(token)
+    assert validated["jti"]
+
+    gen.revoke(validated["jti"])
+    try:
+        assert gen.validate(token) is None
+        assert gen.validate(gen.create(username="fred", pk=9)) is not None
+    finally:
+        gen.revoked.clear()
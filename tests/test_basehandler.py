@@ -36,3 +36,40 @@ def test_stupid_handler(evloop):
         yield from handler("cool")
 
     evloop.run_until_complete(run_handler())
+
+
+class FakeSocket:
+    encoded = 0
+
+    def __init__(self, open=True, fail=False):
+        self.open = open
+        self.fail = fail
+        self.pipeline = None
+        self.sent = []
+
+    @asyncio.coroutine
+    def encode(self, message):
+        FakeSocket.encoded += 1
+        return "encoded {}".format(message)
+
+    @asyncio.coroutine
+    def send_encoded(self, data):
+        if self.fail:
+            raise ConnectionError("gone")
+        self.sent.append(data)
+
+
+def test_broadcast(evloop):
+    handler = BaseHandler()
+    sender, other, closed, broken = (FakeSocket(), FakeSocket(),
+        FakeSocket(open=False), FakeSocket(fail=True))
+    for ws in (sender, other, closed, broken):
+        handler.add_websocket(ws)
+
+    FakeSocket.encoded = 0
+    sent = evloop.run_until_complete(handler.broadcast("hi", exclude={sender}))
+    assert sent == 1
+    assert FakeSocket.encoded == 1
+    assert other.sent == ["encoded hi"]
+    assert sender.sent == []
+    assert handler.websockets == {sender, other}
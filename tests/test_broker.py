@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from yawf.broker import Broker, BrokerChannelLayer, FrameWriter
+
+from .test_channels import FakeSocket
+
+
+@pytest.fixture
+def evloop():
+    return asyncio.get_event_loop()
+
+
+@asyncio.coroutine
+def wait_for(condition, timeout=2.0):
+    waited = 0.0
+    while not condition() and waited < timeout:
+        yield from asyncio.sleep(0.01)
+        waited += 0.01
+    return condition()
+
+
+def test_publish_between_layers(evloop, tmpdir):
+    path = str(tmpdir.join("channels.sock"))
+    broker = evloop.run_until_complete(Broker(path).start())
+    one, two = BrokerChannelLayer(path), BrokerChannelLayer(path)
+    here, there, elsewhere = FakeSocket(), FakeSocket(), FakeSocket()
+    one.subscribe("chat.room1", here)
+    two.subscribe("chat.*", there)
+    two.subscribe("news", elsewhere)
+
+    @asyncio.coroutine
+    def go():
+        yield from one.wait_connected()
+        yield from two.wait_connected()
+        yield from wait_for(lambda: len(broker.peers) == 2)
+        sent = yield from one.publish("chat.room1", {"message": "hi"})
+        assert sent == 1
+        assert (yield from wait_for(lambda: there.sent))
+
+    try:
+        evloop.run_until_complete(go())
+    finally:
+        one.close()
+        two.close()
+        broker.close()
+
+    assert here.sent == [{"message": "hi"}]
+    assert there.sent == [{"message": "hi"}]
+    assert elsewhere.sent == []
+
+
+def test_publish_before_connecting_is_buffered(evloop, tmpdir):
+    path = str(tmpdir.join("channels.sock"))
+    one, two = BrokerChannelLayer(path), BrokerChannelLayer(path)
+    there = FakeSocket()
+    two.subscribe("chat", there)
+
+    @asyncio.coroutine
+    def go():
+        broker = yield from Broker(path).start()
+        yield from two.wait_connected()
+        yield from wait_for(lambda: len(broker.peers) == 1)
+        # queued while the first layer is still connecting
+        yield from one.publish("chat", "early")
+        assert len(one._out) == 1
+        yield from wait_for(lambda: there.sent)
+        return broker
+
+    broker = None
+    try:
+        broker = evloop.run_until_complete(asyncio.wait_for(go(), 5))
+    finally:
+        one.close()
+        two.close()
+        if broker is not None:
+            broker.close()
+    assert there.sent == ["early"]
+
+
+def test_frame_writer_is_bounded(evloop):
+    writer = FrameWriter(maxsize=2, loop=evloop)
+    for frame in (b"a", b"b", b"c"):
+        writer.put(frame)
+    assert len(writer) == 2
+    assert writer.dropped == 1
+
+
+def test_undeliverable_frames_are_skipped(evloop, tmpdir):
+    path = str(tmpdir.join("channels.sock"))
+    broker = evloop.run_until_complete(Broker(path).start())
+    one, two = BrokerChannelLayer(path), BrokerChannelLayer(path)
+    broken, there = FakeSocket(), FakeSocket()
+
+    @asyncio.coroutine
+    def encode(message):
+        raise AttributeError("'str' object has no attribute 'pop'")
+    broken.encode = encode
+    two.subscribe("broken", broken)
+    two.subscribe("chat", there)
+
+    @asyncio.coroutine
+    def go():
+        yield from one.wait_connected()
+        yield from two.wait_connected()
+        yield from wait_for(lambda: len(broker.peers) == 2)
+        one._out.put(b"not a message")
+        yield from one.publish("broken", "hi")
+        yield from one.publish("chat", "still here")
+        assert (yield from wait_for(lambda: there.sent))
+
+    try:
+        evloop.run_until_complete(go())
+        assert two._task is not None and not two._task.done()
+    finally:
+        one.close()
+        two.close()
+        broker.close()
+    assert there.sent == ["still here"]
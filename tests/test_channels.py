@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from yawf import BaseHandler
+from yawf.channels import ChannelLayer, get_channel_layer
+
+
+class FakeSocket:
+    def __init__(self, open=True):
+        self.open = open
+        self.pipeline = None
+        self.sent = []
+        self.encoded = 0
+
+    @asyncio.coroutine
+    def encode(self, message):
+        self.encoded += 1
+        return message
+
+    @asyncio.coroutine
+    def send_encoded(self, data):
+        self.sent.append(data)
+
+
+@pytest.fixture
+def evloop():
+    return asyncio.get_event_loop()
+
+
+def test_publish_to_group(evloop):
+    layer = ChannelLayer()
+    one, two, three = FakeSocket(), FakeSocket(), FakeSocket()
+    layer.subscribe("chat.room1", one)
+    layer.subscribe("chat.room1", two)
+    layer.subscribe("chat.room2", three)
+
+    sent = evloop.run_until_complete(layer.publish("chat.room1", "hi"))
+    assert sent == 2
+    assert one.sent == two.sent == ["hi"]
+    assert three.sent == []
+    assert one.encoded + two.encoded == 1
+
+
+def test_publish_to_wildcard(evloop):
+    layer = ChannelLayer()
+    everything, room = FakeSocket(), FakeSocket()
+    layer.subscribe("chat.*", everything)
+    layer.subscribe("chat.room1", room)
+
+    evloop.run_until_complete(layer.publish("chat.room1", "hi"))
+    evloop.run_until_complete(layer.publish("chat.room2", "there"))
+    evloop.run_until_complete(layer.publish("news", "nope"))
+    assert everything.sent == ["hi", "there"]
+    assert room.sent == ["hi"]
+
+
+def test_publish_drops_closed_members(evloop):
+    layer = ChannelLayer()
+    closed = FakeSocket(open=False)
+    layer.subscribe("chat", closed)
+    assert evloop.run_until_complete(layer.publish("chat", "hi")) == 0
+    assert layer.groups == {}
+    assert layer.memberships == {}
+
+
+def test_handler_leaves_groups_on_close(evloop):
+    class Chat(BaseHandler):
+        @asyncio.coroutine
+        def handle(self, ws, **kwargs):
+            self.channels.subscribe("chat.lobby", ws)
+            self.channels.subscribe("chat.*", ws)
+            assert ws in self.channels.members("chat.lobby")
+
+    ws = FakeSocket()
+    evloop.run_until_complete(Chat()(ws))
+    assert ws not in get_channel_layer().memberships
+    assert "chat.lobby" not in get_channel_layer().groups
@@ -121,3 +121,24 @@ def test_init_and_new_command_with_call_command():
     assert os.path.exists(os.path.join(app_dir, "commands", "testit.py"))
 
     shutil.rmtree(create_path)
+
+
+def test_run_server_with_workers():
+    app = mock.MagicMock(App)()
+    command = run.Command(app=app)
+    command.run_command(argv=["--workers", "4"])
+    assert app.run.call_args[1]["workers"] == 4
+
+
+def test_run_server_with_loop():
+    app = mock.MagicMock(App)()
+    command = run.Command(app=app)
+    command.run_command(argv=["--loop", "uvloop"])
+    assert app.run.call_args[1]["loop"] == "uvloop"
+
+
+def test_run_server_with_handoff_socket():
+    app = mock.MagicMock(App)()
+    command = run.Command(app=app)
+    command.run_command(argv=["--handoff-socket", "/tmp/yawf.sock"])
+    assert app.run.call_args[1]["handoff"] == "/tmp/yawf.sock"
@@ -0,0 +1,39 @@
+import os
+import socket
+import threading
+
+from yawf.handoff import HandoffListener, receive_socket
+from yawf.workers import bind_socket
+
+
+def test_receive_socket_without_server(tmpdir):
+    assert receive_socket(str(tmpdir.join("handoff.sock"))) is None
+
+
+def test_handoff_listening_socket(tmpdir):
+    path = str(tmpdir.join("handoff.sock"))
+    sock = bind_socket("127.0.0.1", 0)
+    handed_off = threading.Event()
+    listener = HandoffListener(path, sock, handed_off.set).start()
+    try:
+        received = receive_socket(path)
+        assert handed_off.wait(2)
+        assert listener.handed_off
+        assert received.getsockname() == sock.getsockname()
+    finally:
+        listener.close()
+        sock.close()
+    # the successor takes over the path, the old server leaves it alone
+    assert os.path.exists(path)
+
+    # the old server closing its copy leaves the new one listening
+    client = socket.create_connection(received.getsockname(), timeout=2)
+    received.setblocking(True)
+    conn, _ = received.accept()
+    conn.close()
+    client.close()
+
+    successor = HandoffListener(path, received, lambda: None).start()
+    successor.close()
+    received.close()
+    assert not os.path.exists(path)
@@ -1,14 +1,17 @@
 import asyncio
+import time
+from unittest import mock
 
 import pytest
 
 from websockets import serve, connect
 
 from yawf.protocol import WebSocket
-from yawf.middlewares import Middleware
+from yawf.middlewares import Middleware, Pipeline
 from yawf.middlewares import utils, core
 from yawf.conf import patch_settings
 from yawf.auth import JWTTokenAuth
+from yawf.revocation import RevocationList
 from yawf.compatibility import yayson
 from yawf import App
 
@@ -42,8 +45,110 @@ def test_middleware_loading():
     loop.run_until_complete(testit())
 
 
+@patch_settings(middleware=[
+    "yawf.middlewares.core.JSONMiddleware",
+    "yawf.middlewares.core.JWTMiddleware",
+    "yawf.middlewares.core.DoesNotExist",
+    ])
+def test_pipeline_from_settings():
+    pipeline = Pipeline.from_settings()
+    assert pipeline.middlewares == (core.JSONMiddleware, core.JWTMiddleware)
+
+    bound = pipeline.bind("websocket")
+    json, jwt = bound.middlewares
+    assert isinstance(json, core.JSONMiddleware)
+    assert isinstance(jwt, core.JWTMiddleware)
+    assert json.websocket == jwt.websocket == "websocket"
+    assert bound.async_recv
+    loop = asyncio.get_event_loop()
+    message = loop.run_until_complete(bound.recv('{"foo": "bar"}'))
+    assert message == {"foo": "bar", "auth_user": None}
+    assert bound.send_sync({"foo": "bar", "auth_user": None}) == '{"foo": "bar"}'
+
+
+def test_pipeline_binds_per_connection():
+    closed = []
+
+    class Counter(Middleware):
+        def __init__(self, websocket=None):
+            super().__init__(websocket)
+            self.count = 0
+
+        def on_recv(self, message):
+            self.count += 1
+            return self.count
+
+        def on_close(self):
+            closed.append(self.websocket)
+
+    pipeline = Pipeline([Counter])
+    one, two = pipeline.bind("one"), pipeline.bind("two")
+    assert one.recv_sync("") == 1
+    assert one.recv_sync("") == 2
+    assert two.recv_sync("") == 1
+
+    one.close()
+    one.close()
+    assert closed == ["one"]
+
+
+def test_pipeline_sync_and_async_hooks():
+    class Sync(Middleware):
+        def on_recv(self, message):
+            return message + ["sync"]
+
+    class Async(Middleware):
+        @asyncio.coroutine
+        def on_recv(self, message):
+            return message + ["async"]
+
+    sync = Pipeline([Sync])
+    assert not sync.async_recv
+    assert sync.bind().recv_sync([]) == ["sync"]
+
+    mixed = Pipeline([Sync, Async])
+    assert mixed.async_recv
+    assert not mixed.async_send
+
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(mixed.bind().recv([])) == ["sync", "async"]
+
+
+@patch_settings(middleware=["yawf.middlewares.core.JSONMiddleware"])
+def test_middleware_stats():
+    app = App()
+    app.reload_middleware()
+    assert app.middleware_stats() is None
+
+    app.enable_middleware_stats()
+    bound = app.pipeline.bind()
+    assert bound.recv_sync('{"foo": "bar"}') == {"foo": "bar"}
+    assert bound.send_sync({"foo": "bar"}) == '{"foo": "bar"}'
+    assert bound.send_sync({"foo": "bar"}) == '{"foo": "bar"}'
+
+    stats = app.middleware_stats()["yawf.middlewares.core.JSONMiddleware"]
+    assert stats["recv"]["calls"] == 1
+    assert stats["send"]["calls"] == 2
+    assert sum(count for _, count in stats["send"]["histogram"]) == 2
+    assert stats["send"]["total"] > 0
+
+    app.disable_middleware_stats()
+    assert app.middleware_stats() is None
+    assert app.pipeline.stats is None
+
+
+@patch_settings(middleware=["yawf.middlewares.core.JSONMiddleware"])
+def test_reload_middleware():
+    app = App()
+    pipeline = app.reload_middleware()
+    assert app.pipeline is pipeline
+    assert app.pipeline is pipeline
+    assert app.reload_middleware() is not pipeline
+
+
 @patch_settings(middleware=["yawf.middlewares.core.JSONMiddleware"])
 def test_run_middleware():
+    App().reload_middleware()
     run = App().run_middlewares
     message = '{"foo": "bar"}'
 
@@ -60,6 +165,7 @@ def test_run_middleware():
 
 @patch_settings(middleware=["yawf.middlewares.core.JSONMiddleware"])
 def test_run_middleware_protocol_builder(client_server):
+    App().reload_middleware()
 
     @asyncio.coroutine
     def handler(ws, path):
@@ -86,6 +192,7 @@ def test_run_middleware_protocol_builder(client_server):
     "yawf.middlewares.core.JWTMiddleware"
     ])
 def test_jwt_middleware(client_server):
+    App().reload_middleware()
     auth = JWTTokenAuth()
     token = auth.create(id=1, username="megaman")
 
@@ -111,3 +218,136 @@ def test_jwt_middleware(client_server):
     loop.run_until_complete(client.worker)
     server.close()
     loop.run_until_complete(server.wait_closed())
+
+
+@patch_settings(secret_key="okayoky")
+def test_jwt_middleware_authenticates_once():
+    token = JWTTokenAuth().create(id=1, username="megaman")
+    websocket = mock.Mock(auth_user=None)
+    validate = mock.Mock(wraps=JWTTokenAuth.validate)
+    loop = asyncio.get_event_loop()
+
+    with mock.patch.object(core.JWTMiddleware.validator, "avalidate",
+                           asyncio.coroutine(validate)):
+        bound = Pipeline([core.JWTMiddleware]).bind(websocket)
+        loop.run_until_complete(bound.open(query={"token": [token]}))
+        assert websocket.auth_user["id"] == 1
+
+        for _ in range(3):
+            message = loop.run_until_complete(bound.recv({"foo": "bar"}))
+            assert message["auth_user"]["id"] == 1
+        message = loop.run_until_complete(
+            bound.recv({"foo": "bar", "authentication": token}))
+        assert message["auth_user"]["id"] == 1
+        assert websocket.auth_user["username"] == "megaman"
+        assert validate.call_count == 1
+
+
+def test_jwt_middleware_revalidates_expired_token():
+    validate = mock.Mock(side_effect=[{"id": 1, "exp": time.time() - 1}, None])
+    loop = asyncio.get_event_loop()
+
+    with mock.patch.object(core.JWTMiddleware.validator, "avalidate",
+                           asyncio.coroutine(validate)):
+        bound = Pipeline([core.JWTMiddleware]).bind()
+        message = loop.run_until_complete(bound.recv({"authentication": "t"}))
+        assert message["auth_user"]["id"] == 1
+        assert loop.run_until_complete(bound.recv({}))["auth_user"] is None
+        assert loop.run_until_complete(bound.recv({}))["auth_user"] is None
+        assert validate.call_count == 2
+
+
+def test_jwt_middleware_does_not_remember_forged_token():
+    identities = {"good": {"id": 1}, "forged": None}
+    validate = mock.Mock(side_effect=identities.get)
+    loop = asyncio.get_event_loop()
+
+    with mock.patch.object(core.JWTMiddleware.validator, "avalidate",
+                           asyncio.coroutine(validate)):
+        bound = Pipeline([core.JWTMiddleware]).bind()
+        loop.run_until_complete(bound.recv({"authentication": "good"}))
+        for _ in range(2):
+            message = loop.run_until_complete(
+                bound.recv({"authentication": "forged"}))
+            assert message["auth_user"] == {"id": 1}
+        assert validate.call_count == 3
+        message = loop.run_until_complete(
+            bound.recv({"authentication": "good"}))
+        assert message["auth_user"] == {"id": 1}
+        assert validate.call_count == 3
+
+
+def test_jwt_middleware_drops_revoked_identity():
+    validate = mock.Mock(return_value={"id": 1, "jti": "abc"})
+    websocket = mock.Mock(auth_user=None)
+    revoked = RevocationList()
+    loop = asyncio.get_event_loop()
+
+    with mock.patch.object(core.JWTMiddleware.validator, "avalidate",
+                           asyncio.coroutine(validate)), \
+            mock.patch.object(core.JWTMiddleware.validator, "revoked", revoked):
+        bound = Pipeline([core.JWTMiddleware]).bind(websocket)
+        message = loop.run_until_complete(bound.recv({"authentication": "t"}))
+        assert message["auth_user"]["id"] == 1
+        assert loop.run_until_complete(bound.recv({}))["auth_user"]["id"] == 1
+
+        revoked.add("abc")
+        assert loop.run_until_complete(bound.recv({}))["auth_user"] is None
+        assert websocket.auth_user is None
+        assert validate.call_count == 1
+
+
+@patch_settings(secret_key="okayoky", middleware=[
+    "yawf.middlewares.core.JSONMiddleware",
+    "yawf.middlewares.core.JWTMiddleware"
+    ])
+def test_run_middlewares_does_not_share_identity():
+    app = App()
+    app.reload_middleware()
+    token = JWTTokenAuth().create(id=1, username="fred")
+    loop = asyncio.get_event_loop()
+
+    message = loop.run_until_complete(app.run_middlewares(
+        yayson.dumps({"authentication": token})))
+    assert message["auth_user"]["username"] == "fred"
+    message = loop.run_until_complete(app.run_middlewares('{"anon": 1}'))
+    assert message["auth_user"] is None
+
+
+@patch_settings(secret_key="okayoky", middleware=[
+    "yawf.middlewares.core.JSONMiddleware",
+    "yawf.middlewares.core.JWTMiddleware"
+    ])
+def test_jwt_middleware_validates_query_token_on_open():
+    app = App()
+    app.reload_middleware()
+    token = JWTTokenAuth().create(id=1, username="megaman")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    seen = []
+
+    @app.route("/pushes")
+    @asyncio.coroutine
+    def pushes(ws, **kwargs):
+        seen.append(ws.auth_user)
+
+    class Socket(WebSocket):
+        def __init__(self):
+            self.closed_with = None
+
+        @asyncio.coroutine
+        def close(self, code=1000, reason=""):
+            self.closed_with = code
+
+    handler = app.as_handler()
+    loop = asyncio.get_event_loop()
+
+    ws = Socket()
+    loop.run_until_complete(handler(ws, "/pushes?token={}".format(token)))
+    assert seen[0]["username"] == "megaman"
+    assert ws.closed_with == 1000
+
+    ws = Socket()
+    loop.run_until_complete(handler(ws, "/pushes?token={}AAAA".format(token[:-4])))
+    assert len(seen) == 1
+    assert ws.closed_with == 1008
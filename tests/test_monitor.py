@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import pytest
+
+from yawf.monitor import LagMonitor
+
+
+@pytest.fixture
+def evloop():
+    return asyncio.get_event_loop()
+
+
+def test_monitor_measures_lag(evloop):
+    samples = []
+    monitor = LagMonitor(interval=0.01, reject_above=0.02, shed_above=0.05,
+                         smoothing=1.0, on_sample=samples.append, loop=evloop)
+
+    @asyncio.coroutine
+    def go():
+        monitor.start()
+        yield from asyncio.sleep(0.05)
+        assert monitor.samples and not monitor.overloaded
+        time.sleep(0.1)  # block the loop
+        yield from asyncio.sleep(0.02)
+
+    try:
+        evloop.run_until_complete(go())
+    finally:
+        monitor.stop()
+    assert monitor.max_lag >= 0.05
+    assert samples and samples[0] is monitor
+    assert not monitor.running
+
+
+def test_monitor_thresholds(evloop):
+    monitor = LagMonitor(reject_above=0.1, shed_above=0.5, loop=evloop)
+    monitor.lag = 0.2
+    assert monitor.overloaded and not monitor.shedding
+    monitor.lag = 0.6
+    assert monitor.stats()["shedding"]
+    assert not LagMonitor(loop=evloop).overloaded
@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+from websockets.server import WebSocketServerProtocol
+
+from yawf import App
+from yawf.compatibility import ensure_future
+from yawf.conf import patch_settings
+from yawf.protocol import WebSocket
+from yawf.queues import SendQueue
+
+
+@pytest.fixture
+def evloop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+class SlowWriter:
+    def __init__(self, loop):
+        self.written = []
+        self.gate = asyncio.Event()
+
+    @asyncio.coroutine
+    def __call__(self, data):
+        yield from self.gate.wait()
+        self.written.append(data)
+
+
+def fill(loop, queue, frames):
+    @asyncio.coroutine
+    def put_all():
+        results = []
+        for frame in frames:
+            result = yield from queue.put(frame)
+            results.append(result)
+        return results
+    return loop.run_until_complete(put_all())
+
+
+def test_send_queue_writes_in_order(evloop):
+    writer = SlowWriter(evloop)
+    writer.gate.set()
+    queue = SendQueue(writer, maxsize=4, loop=evloop)
+    fill(evloop, queue, [1, 2, 3])
+    evloop.run_until_complete(asyncio.sleep(0.01))
+    assert writer.written == [1, 2, 3]
+    assert queue.stats()["sent"] == 3
+
+
+@pytest.mark.parametrize("policy, written, dropped", [
+    ("drop_oldest", [1, 4, 5], 2),
+    ("drop_newest", [1, 2, 3], 2),
+    ])
+def test_send_queue_drop_policies(evloop, policy, written, dropped):
+    writer = SlowWriter(evloop)
+    queue = SendQueue(writer, maxsize=2, policy=policy, loop=evloop)
+    fill(evloop, queue, [1])
+    evloop.run_until_complete(asyncio.sleep(0))  # the writer holds frame 1
+    fill(evloop, queue, [2, 3, 4, 5])
+    assert queue.stats()["max_depth"] == 2
+
+    writer.gate.set()
+    evloop.run_until_complete(asyncio.sleep(0.01))
+    assert writer.written == written
+    assert queue.dropped == dropped
+
+
+def test_send_queue_disconnect_policy(evloop):
+    overflowed = []
+    writer = SlowWriter(evloop)
+    queue = SendQueue(writer, maxsize=1, policy="disconnect", loop=evloop,
+                      on_overflow=lambda: overflowed.append(True))
+    assert fill(evloop, queue, [1, 2, 3]) == [True, False, False]
+    assert overflowed == [True]
+    assert queue.closed
+
+
+def test_send_queue_block_policy(evloop):
+    writer = SlowWriter(evloop)
+    queue = SendQueue(writer, maxsize=1, loop=evloop)
+    fill(evloop, queue, [1])
+    evloop.run_until_complete(asyncio.sleep(0))
+    fill(evloop, queue, [2])
+
+    blocked = ensure_future(queue.put(3), loop=evloop)
+    evloop.run_until_complete(asyncio.sleep(0.01))
+    assert not blocked.done()
+
+    writer.gate.set()
+    evloop.run_until_complete(blocked)
+    evloop.run_until_complete(asyncio.sleep(0.01))
+    assert writer.written == [1, 2, 3]
+    assert queue.dropped == 0
+
+
+def test_send_queue_bad_policy():
+    with pytest.raises(ValueError):
+        SendQueue(None, policy="shrug", loop=object())
+
+
+class Wire(WebSocketServerProtocol):
+    """ stands in for the transport under `WebSocket`.
+    """
+    open = True
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.frames = []
+
+    @asyncio.coroutine
+    def send(self, data):
+        yield from asyncio.sleep(self.delay)
+        self.frames.append(data)
+
+    @asyncio.coroutine
+    def close(self, code=1000, reason=""):
+        self.frames.append(("close", code))
+
+
+class QueuedSocket(WebSocket, Wire):
+    pass
+
+
+@patch_settings(middleware=[], send_queue_size=4, send_queue_policy="block")
+def test_queued_frames_are_flushed_before_close(evloop):
+    app = App()
+    app.reload_middleware()
+
+    @app.route("/goodbye")
+    @asyncio.coroutine
+    def goodbye(ws, **kwargs):
+        yield from ws.send("goodbye")
+        yield from ws.send("again")
+
+    ws = QueuedSocket(delay=0.01)
+    evloop.run_until_complete(app.as_handler(loop=evloop)(ws, "/goodbye"))
+    assert ws.frames == ["goodbye", "again", ("close", 1000)]
+    stats = ws.queue_stats()
+    assert stats["sent"] == 2
+    assert stats["dropped"] == 0
+
+
+@patch_settings(middleware=[], send_queue_size=4, send_queue_policy="block",
+                send_queue_close_timeout=0.05)
+def test_frames_left_at_close_are_dropped(evloop):
+    app = App()
+    app.reload_middleware()
+
+    @app.route("/stuck")
+    @asyncio.coroutine
+    def stuck(ws, **kwargs):
+        for message in ("one", "two", "three"):
+            yield from ws.send(message)
+
+    ws = QueuedSocket(delay=60)
+    evloop.run_until_complete(app.as_handler(loop=evloop)(ws, "/stuck"))
+    assert ws.frames == [("close", 1000)]
+    stats = ws.queue_stats()
+    assert stats["sent"] == 0
+    assert stats["dropped"] == 3
+
+
+def test_write_errors_count_as_drops(evloop):
+    @asyncio.coroutine
+    def broken(data):
+        raise ConnectionResetError()
+
+    queue = SendQueue(broken, maxsize=4, loop=evloop)
+    fill(evloop, queue, ["a", "b"])
+    evloop.run_until_complete(queue.join())
+    assert queue.closed
+    assert queue.stats()["dropped"] == 2
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import uuid
+
+from yawf.revocation import BloomFilter, RevocationList
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(100)
+    bloom.add(12345)
+    assert 12345 in bloom
+    misses = sum(1 for key in range(100000, 101000) if key in bloom)
+    assert misses < 20
+
+
+def test_revocation_list():
+    revoked = RevocationList(capacity=4)
+    ids = [uuid.uuid4().hex for _ in range(10)]
+    for jti in ids:
+        revoked.add(jti)
+    revoked.add(ids[0])
+
+    assert len(revoked) == 10
+    assert all(jti in revoked for jti in ids)
+    assert uuid.uuid4().hex not in revoked
+
+
+def test_revocation_list_load():
+    ids = [uuid.uuid4().hex for _ in range(1000)]
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "w") as revoked_file:
+            revoked_file.write("\n".join(ids) + "\n\n")
+
+        revoked = RevocationList()
+        revoked.add("already")
+        assert revoked.load(path) == 1001
+    finally:
+        os.remove(path)
+
+    assert all(jti in revoked for jti in ids)
+    assert "already" in revoked
+    assert "other" not in revoked
+    revoked.clear()
+    assert ids[0] not in revoked
+
+
+def test_revocation_list_load_in_chunks():
+    ids = [uuid.uuid4().hex for _ in range(500)]
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "w") as revoked_file:
+            revoked_file.write("\n".join(ids + ids[:100]) + "\n")
+
+        revoked = RevocationList()
+        revoked.add(ids[0])
+        assert revoked.load(path, chunk_size=64) == 500
+    finally:
+        os.remove(path)
+
+    keys = list(revoked._keys)
+    assert keys == sorted(set(keys))
+    assert all(jti in revoked for jti in ids)
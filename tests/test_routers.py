@@ -1,6 +1,8 @@
+import uuid
+
 import pytest
 
-from yawf import router
+from yawf import router, BaseHandler
 
 def test_router_appends_slash():
     urls = router.Router()
@@ -47,3 +49,283 @@ def test_unresolved_route():
     urls = router.Router()
     with pytest.raises(router.RouterResolutionError):
         urls.resolve("/")
+
+
+@pytest.mark.parametrize("path, expect", [
+    ("/", None),
+    ("/this", {}),
+    ("/this/", {}),
+    ("/this//", None),
+    ("/this/1", {"that": "1"}),
+    ("/this/1/", {"that": "1"}),
+    ("/this/1/2", None),
+    ("this/1", None),
+    ])
+def test_router_tree_matches_like_regex(path, expect):
+    urls = router.Router()
+    urls.route("/this")(lambda x: x)
+    urls.route("/this/{that}")(lambda x: x)
+    match = urls._match(path)
+    if expect is None:
+        assert match is None
+    else:
+        kwargs, _ = match
+        assert kwargs == expect
+
+
+def test_router_first_registered_route_wins():
+    urls = router.Router()
+
+    @urls.route("/api/{obj}/")
+    def dynamic(ws, **kwargs):
+        pass
+
+    @urls.route("/api/racoons/")
+    def static(ws, **kwargs):
+        pass
+
+    kwargs, handler = urls.resolve("/api/racoons/")
+    assert handler is dynamic
+    assert kwargs == {"obj": "racoons"}
+
+
+def test_router_group_patterns_span_segments():
+    urls = router.Router()
+
+    @urls.route("/files/{name:.+}")
+    def files(ws, **kwargs):
+        pass
+
+    kwargs, handler = urls.resolve("/files/a/b/c.txt")
+    assert handler is files
+    assert kwargs == {"name": "a/b/c.txt"}
+
+
+def test_router_root_only_matches_root():
+    urls = router.Router()
+    urls.route("/")(lambda x: x)
+    assert urls._match("/") is not None
+    assert urls._match("//") is None
+
+
+def test_router_cache_is_per_router():
+    one, two = router.Router(), router.Router()
+    one.route("/this")(lambda x: x)
+    one.resolve("/this")
+    one.resolve("/this")
+    assert one.cache_info().hits == 1
+    assert one.cache_info().misses == 1
+    assert two.cache_info().currsize == 0
+
+
+def test_router_cache_remembers_unresolved_paths():
+    urls = router.Router(miss_cache_size=1)
+    for path in ("/nope", "/nope", "/other"):
+        with pytest.raises(router.RouterResolutionError):
+            urls.resolve(path)
+
+    info = urls.cache_info()
+    assert info.hits == 1
+    assert info.misses == 2
+    assert info.evictions == 1
+    assert info.currsize == 1
+
+
+def test_router_cache_cleared_by_new_routes():
+    urls = router.Router()
+    with pytest.raises(router.RouterResolutionError):
+        urls.resolve("/this")
+
+    urls.route("/this")(lambda x: x)
+    kwargs, _ = urls.resolve("/this")
+    assert kwargs == {}
+
+
+def test_router_cache_returns_fresh_kwargs():
+    urls = router.Router()
+    urls.route("/this/{that}")(lambda x: x)
+    kwargs, _ = urls.resolve("/this/1")
+    kwargs["LOOP"] = None
+    kwargs, _ = urls.resolve("/this/1")
+    assert kwargs == {"that": "1"}
+
+
+def test_router_freeze_builds_static_table():
+    urls = router.Router()
+    urls.route("/")(lambda x: x)
+    urls.route("/echo")(lambda x: x)
+    urls.route("/api/{obj}")(lambda x: x)
+    urls.freeze()
+    assert set(urls._static) == {"/", "/echo", "/echo/"}
+    kwargs, route = urls._match("/echo/")
+    assert kwargs == {}
+    assert route.handler is urls.routes["/echo"][1]
+    assert urls._match("/api/racoons") is not None
+
+
+def test_router_static_route_shadowed_by_earlier_dynamic_route():
+    urls = router.Router()
+
+    @urls.route("/api/{obj}")
+    def dynamic(ws, **kwargs):
+        pass
+
+    @urls.route("/api/racoons")
+    def static(ws, **kwargs):
+        pass
+
+    urls.freeze()
+    kwargs, route = urls._static["/api/racoons"]
+    assert kwargs == {"obj": "racoons"}
+    assert route.handler is dynamic
+
+
+def test_router_routes_added_after_freeze():
+    urls = router.Router()
+    urls.route("/echo")(lambda x: x)
+    urls.freeze()
+
+    @urls.route("/chatroom")
+    def chatroom(ws, **kwargs):
+        pass
+
+    _, handler = urls.resolve("/chatroom")
+    assert handler is chatroom
+
+
+@pytest.mark.parametrize("route, path, expect", [
+    ("/rooms/{room_id:int}", "/rooms/42", {"room_id": 42}),
+    ("/rooms/{room_id:int}", "/rooms/abc", None),
+    ("/sessions/{sid:uuid}", "/sessions/12345678-1234-5678-1234-567812345678",
+        {"sid": uuid.UUID("12345678-1234-5678-1234-567812345678")}),
+    ("/sessions/{sid:uuid}", "/sessions/1234", None),
+    ("/posts/{slug:slug}/", "/posts/hello-world/", {"slug": "hello-world"}),
+    ("/files/{name:path}", "/files/a/b.txt", {"name": "a/b.txt"}),
+    ])
+def test_router_converters(route, path, expect):
+    urls = router.Router()
+    urls.route(route)(lambda x: x)
+    regex, _ = urls.routes[route]
+    assert (regex.match(path) is None) == (expect is None)
+    if expect is None:
+        with pytest.raises(router.RouterResolutionError):
+            urls.resolve(path)
+    else:
+        kwargs, _ = urls.resolve(path)
+        assert kwargs == expect
+
+
+def test_router_custom_converter():
+    class Upper(router.Converter):
+        regex = "[a-z]+"
+
+        def to_python(self, value):
+            if value == "nope":
+                raise ValueError(value)
+            return value.upper()
+
+    class MyRouter(router.Router):
+        pass
+
+    MyRouter.register_converter("upper", Upper())
+    assert "upper" not in router.Router.converters
+
+    urls = MyRouter()
+    urls.route("/say/{word:upper}")(lambda x: x)
+    kwargs, _ = urls.resolve("/say/hello")
+    assert kwargs == {"word": "HELLO"}
+    with pytest.raises(router.RouterResolutionError):
+        urls.resolve("/say/nope")
+
+
+def test_router_mount():
+    chat = router.Router()
+
+    @chat.route("/")
+    def lobby(ws, **kwargs):
+        pass
+
+    @chat.route("/rooms/{room_id:int}")
+    def room(ws, **kwargs):
+        pass
+
+    urls = router.Router()
+    urls.mount("/chat/", chat)
+
+    assert urls.resolve("/chat") == ({}, lobby)
+    assert urls.resolve("/chat/") == ({}, lobby)
+    assert urls.resolve("/chat/rooms/1") == ({"room_id": 1}, room)
+    assert chat.cache_info().currsize == 2
+    assert urls.cache_info().currsize == 0
+
+    with pytest.raises(router.RouterResolutionError) as err:
+        urls.resolve("/chat/nope")
+    assert str(err.value) == "could not resolve the path /chat/nope"
+
+
+def test_router_mounted_route_paths():
+    rooms, chat = router.Router(), router.Router()
+
+    @rooms.route("/room/{room_id:int}")
+    def room(ws, **kwargs):
+        pass
+
+    @chat.route("/")
+    def lobby(ws, **kwargs):
+        pass
+
+    chat.mount("/rooms", rooms)
+    urls = router.Router()
+
+    @urls.route("/")
+    def index(ws, **kwargs):
+        pass
+
+    urls.mount("/chat", chat)
+    assert urls.lookup("/")[1].path == "/"
+    assert urls.lookup("/chat")[1].path == "/chat/"
+    assert urls.lookup("/chat/rooms/room/3")[1].path == \
+        "/chat/rooms/room/{room_id:int}"
+
+
+def test_router_freeze_mounts():
+    chat = router.Router()
+
+    @chat.route("/rooms/{room_id:int}")
+    def room(ws, **kwargs):
+        pass
+
+    urls = router.Router()
+    urls.mount("/chat", chat)
+    assert chat._static is None
+    urls.freeze()
+    assert chat._static is not None and chat._tree is not None
+
+
+@pytest.mark.parametrize("prefix", ["/", "/a/b", "/{group}", "/a-b"])
+def test_router_bad_mount(prefix):
+    urls = router.Router()
+    with pytest.raises(router.RouterSyntaxError):
+        urls.mount(prefix, router.Router())
+
+
+def test_router_route_middleware():
+    class Telemetry(BaseHandler):
+        middleware = []
+
+    chat = router.Router(middleware=["yawf.middlewares.core.JSONMiddleware"])
+    chat.route("/")(lambda x: x)
+
+    urls = router.Router()
+    urls.route("/")(lambda x: x)
+    urls.route("/binary", middleware=["a.B"])(lambda x: x)
+    urls.route("/telemetry")(Telemetry)
+    urls.mount("/chat", chat)
+
+    assert urls.lookup("/")[1].middleware is None
+    assert urls.lookup("/binary")[1].middleware == ("a.B",)
+    assert urls.lookup("/telemetry")[1].middleware == ()
+    assert urls.lookup("/chat")[1].middleware == (
+        "yawf.middlewares.core.JSONMiddleware",)
+    assert urls.stacks() == {None, ("a.B",), (),
+                             ("yawf.middlewares.core.JSONMiddleware",)}
@@ -0,0 +1,66 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+
+from yawf import serializers
+from yawf.conf import patch_settings
+
+
+def test_default_serializer():
+    serializer = serializers.get_serializer()
+    assert serializer.name in ("ujson", "json")
+    assert serializers.get_serializer() is serializer
+
+
+@patch_settings(serializer="json")
+def test_serializer_from_settings():
+    serializer = serializers.get_serializer()
+    assert serializer.name == "json"
+    message = {"when": datetime(2015, 11, 7, 12, 4, 8, 9), "raw": b"bytes"}
+    assert serializer.loads(serializer.dumps(message)) == {
+        "when": "2015-11-07T12:04:08.000009Z", "raw": "bytes"}
+
+
+def test_orjson_serializer():
+    pytest.importorskip("orjson")
+    serializer = serializers.get_serializer("orjson")
+    dumped = serializer.dumps({"foo": "bar", "raw": b"bytes"})
+    assert isinstance(dumped, str)
+    assert serializer.loads(dumped) == {"foo": "bar", "raw": "bytes"}
+
+
+@pytest.mark.parametrize("name", ["json", "ujson", "orjson"])
+def test_serializers_agree_on_datetimes(name):
+    pytest.importorskip(name)
+    serializer = serializers.get_serializer(name)
+    message = {"when": datetime(2015, 11, 7, 12, 4, 8, 9)}
+    assert serializer.loads(serializer.dumps(message)) == {
+        "when": "2015-11-07T12:04:08.000009Z"}
+
+    # orjson leaves out a zero fraction of a second
+    when = serializer.loads(serializer.dumps(
+        {"when": datetime(2015, 11, 7, 12, 4, 8)}))["when"]
+    assert when == ("2015-11-07T12:04:08Z" if name == "orjson"
+                    else "2015-11-07T12:04:08.000000Z")
+
+
+@pytest.mark.parametrize("name", ["json", "ujson", "orjson"])
+def test_serializers_agree_on_other_types(name):
+    pytest.importorskip(name)
+    serializer = serializers.get_serializer(name)
+    key = uuid.UUID("12345678-1234-5678-1234-567812345678")
+    message = {"key": key, "day": date(2015, 11, 7), "other": object()}
+    assert serializer.loads(serializer.dumps(message)) == {
+        "key": str(key), "day": "2015-11-07", "other": None}
+
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError):
+        serializers.get_serializer("pickle")
+
+
+def test_register_serializer():
+    serializers.register_serializer("upper", lambda: serializers.Serializer(
+        "upper", lambda obj: str(obj).upper(), str.lower))
+    assert serializers.get_serializer("upper").dumps("hi") == "HI"
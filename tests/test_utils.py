@@ -1,6 +1,9 @@
+import asyncio
+from unittest import mock
+
 import pytest
 
-from yawf import utils
+from yawf import compatibility, utils
 from yawf.conf import patch_settings, settings
 
 
@@ -36,3 +39,29 @@ def test_lazy_property():
     assert hasattr(testit, "_lazy_say_hi") is False
     assert testit.say_hi == "hi"
     assert testit._lazy_say_hi == "hi"
+
+
+def test_use_event_loop_falls_back_without_uvloop():
+    policy = asyncio.get_event_loop_policy()
+    with mock.patch.dict("sys.modules", {"uvloop": None}):
+        assert compatibility.use_event_loop("uvloop") == "asyncio"
+    assert asyncio.get_event_loop_policy() is policy
+    assert compatibility.use_event_loop(None) == "asyncio"
+
+
+def test_use_event_loop_installs_uvloop():
+    policy = asyncio.get_event_loop_policy()
+    uvloop = mock.Mock(EventLoopPolicy=asyncio.DefaultEventLoopPolicy)
+    try:
+        with mock.patch.dict("sys.modules", {"uvloop": uvloop}):
+            assert compatibility.use_event_loop("uvloop") == "uvloop"
+        assert isinstance(asyncio.get_event_loop_policy(),
+                          asyncio.DefaultEventLoopPolicy)
+        assert asyncio.get_event_loop_policy() is not policy
+    finally:
+        asyncio.set_event_loop_policy(policy)
+
+
+def test_use_event_loop_unknown():
+    with pytest.raises(ValueError):
+        compatibility.use_event_loop("tornado")
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import signal
+import socket
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from yawf import App
+from yawf.conf import patch_settings
+from yawf.workers import Supervisor, bind_socket
+
+
+def test_bind_socket():
+    sock = bind_socket("127.0.0.1", 0)
+    try:
+        assert sock.getsockname()[1] != 0
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR)
+        client = socket.create_connection(sock.getsockname())
+        client.close()
+    finally:
+        sock.close()
+
+
+def test_supervisor_restarts_crashed_workers(tmpdir):
+    log = tmpdir.join("starts")
+    log.write("")
+
+    def flaky():
+        with open(str(log), "a") as f:
+            f.write("x")
+        if len(log.read()) < 3:
+            os._exit(1)
+
+    supervisor = Supervisor([flaky], restart_delay=0)
+    supervisor.run()
+    assert log.read() == "xxx"
+    assert supervisor.restarts == 2
+    assert supervisor.children == {}
+
+
+def test_supervisor_forwards_signals(tmpdir):
+    def sleeper():
+        time.sleep(30)
+        os._exit(1)
+
+    supervisor = Supervisor([sleeper, sleeper], restart_delay=0)
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    started = time.monotonic()
+    supervisor.run()
+    assert time.monotonic() - started < 10
+    assert supervisor.stopping
+    assert supervisor.restarts == 0
+    assert signal.getsignal(signal.SIGTERM) != supervisor.stop
+
+
+@patch_settings(middleware=[])
+def test_run_app_with_workers():
+    app = App()
+    with mock.patch("yawf.Supervisor") as supervisor:
+        app.run("127.0.0.1", 0, workers=3)
+    targets, = supervisor.call_args[0]
+    assert len(targets) == 3
+    assert supervisor().run.called
+
+
+@patch_settings(middleware=[])
+def test_run_app_with_workers_refuses_a_loop():
+    app = App()
+    loop = asyncio.new_event_loop()
+    with mock.patch("yawf.Supervisor") as supervisor:
+        with pytest.raises(ValueError):
+            app.run("127.0.0.1", 0, workers=2, loop=loop)
+    loop.close()
+    assert not supervisor.called
+
+
+def test_workers_run_in_their_own_process_group(tmpdir):
+    groups = tmpdir.join("groups")
+
+    def record():
+        with open(str(groups), "a") as f:
+            f.write("{0} {1}\n".format(os.getpid(), os.getpgid(0)))
+
+    Supervisor([record]).run()
+    pid, group = groups.read().split()
+    assert pid == group
+    assert int(group) != os.getpgid(0)
@@ -1,8 +1,10 @@
 import abc
 import asyncio
 from datetime import datetime
+import functools as ft
 import importlib
 import logging
+import signal
 from urllib.parse import urlparse, parse_qs
 
 from websockets import serve
@@ -11,8 +13,13 @@ from .router import Router, RouterResolutionError
 from .base import BaseHandler
 from .conf import Settings, settings
 from .utils import singleton
-from .middlewares.utils import collect_middleware
+from .middlewares import ConnectionRefused, Pipeline
+from .middlewares.stats import PipelineStats
 from .protocol import WebSocket
+from .workers import Supervisor, bind_socket
+from .handoff import HANDOFF_SIGNAL, HandoffListener, receive_socket
+from .monitor import LagMonitor
+from .compatibility import current_task, ensure_future, use_event_loop
 
 
 __all__ = ("App", "Router", "BaseHandler", "settings", "Settings")
@@ -29,6 +36,17 @@ class App:
         self.logger = logging.getLogger(self.name)
         self.settings = settings
         self._debug = debug
+        self._pipeline = None
+        self._pipelines = {}
+        self._middleware_stats = None
+        self._connections = {}  # websocket -> the task running its handler
+        self._route_counts = {}  # route path -> open connections
+        self._priorities = {}  # websocket -> its handler's priority
+        self._rejected = 0  # turned away by the connection limits
+        self._lag_rejected = 0  # turned away while the loop lagged
+        self.handed_off = False
+        self.monitor = None
+        self.draining = False
 
     def __str__(self):
         return "<{0} :: {1}>".format(self.__class__.__name__, self.name)
@@ -48,7 +66,7 @@ class App:
         self._debug = value
         return self._debug
 
-    def route(self, path):
+    def route(self, path, *, middleware=None, priority=None):
         """
         proxy to the router allowing for the syntax:
         ::
@@ -59,8 +77,23 @@ class App:
             @asyncio.coroutine
             def handler(ws, **kwargs):
                 pass
+
+        a route can use its own list of middleware instead of
+        `settings.middleware`, an empty list skips middleware altogether:
+        ::
+
+            @app.route("/telemetry", middleware=[])
+            @asyncio.coroutine
+            def telemetry(ws, **kwargs):
+                pass
         """
-        return self.router.route(path)
+        return self.router.route(path, middleware=middleware,
+                                 priority=priority)
+
+    def mount(self, prefix, router):
+        """ proxy to the router, mounting a router under a path segment.
+        """
+        return self.router.mount(prefix, router)
 
     def as_handler(self, *, loop=None, debug=False):
         """ return the router as a coroutine resolving paths as they are
@@ -92,59 +125,433 @@ class App:
             _msg = "{0} -> is open? -> {1}".format(ws, ws.open)
             path = urlparse(path)
             self.logger.debug(_msg)
+            if self.draining:
+                yield from ws.close(code=1001, reason="server shutting down")
+                return
             try:
-                kwargs, handler = self.router.resolve(path.path)
+                kwargs, route = self.router.lookup(path.path)
             except RouterResolutionError as err:
                 _msg = "{0} -> {1}".format(ws, err)
                 self.logger.debug(_msg)
                 yield from ws.close(code=1011, reason="{}".format(err))
                 return
 
+            admitted = self._admit(route)
+            overloaded = self.monitor is not None and self.monitor.overloaded
+            if not admitted or overloaded:
+                if admitted:
+                    self._lag_rejected += 1
+                else:
+                    self._rejected += 1
+                _msg = "{0} -> rejected, {1} connections open".format(
+                    ws, len(self._connections))
+                self.logger.debug(_msg)
+                yield from ws.close(code=1013, reason="try again later")
+                return
+
+            handler = route.handler
+            query = parse_qs(path.query)
             _msg = "{0} -> resolved path -> {1}".format(path, handler)
             self.logger.debug(_msg)
 
             _msg = "{} -> launching handler".format(ws)
             self.logger.debug(_msg)
             kwargs["LOOP"] = loop
-            kwargs["QUERY"] = parse_qs(path.query)
-            yield from handler(ws, **kwargs)
-            yield from ws.close()
+            kwargs["QUERY"] = query
+            self._connections[ws] = current_task(loop)
+            self._priorities[ws] = route.priority
+            counts = self._route_counts
+            counts[route.path] = counts.get(route.path, 0) + 1
+            try:
+                try:
+                    yield from ws.bind_pipeline(
+                        self.pipeline_for(route.middleware), query=query)
+                except ConnectionRefused as err:
+                    _msg = "{0} -> refused -> {1}".format(ws, err)
+                    self.logger.debug(_msg)
+                    yield from ws.close(code=err.code, reason=err.reason)
+                    return
+                yield from handler(ws, **kwargs)
+                yield from ws.close()
+            finally:
+                self._connections.pop(ws, None)
+                self._priorities.pop(ws, None)
+                counts[route.path] -= 1
+                if ws.pipeline is not None:
+                    ws.pipeline.close()
             _msg = "{} -> closed".format(ws)
             self.logger.debug(_msg)
 
         return router
 
-    @staticmethod
-    @asyncio.coroutine
-    def run_middlewares(message, *, on="recv"):
-        middlewares = yield from collect_middleware()
-        routines = []
-        for middleware in middlewares:
-            handler = middleware.delegate(on=on)
-            if handler is not None:
-                routines.append(handler)
-        if on == "send":
-            routines = reversed(routines)
-
-        for routine in routines:
-            message = yield from routine(message)
-            assert message is not None, "A middleware returned an invalid message"
+    def _admit(self, route):
+        limit = self.settings.get("max_connections")
+        if limit is not None and len(self._connections) >= limit:
+            return False
+        limit = self.settings.get("max_connections_per_route")
+        if isinstance(limit, dict):
+            limit = limit.get(route.path)
+        if limit is not None and\
+                self._route_counts.get(route.path, 0) >= limit:
+            return False
+        return True
+
+    def start_monitor(self, *, loop=None):
+        """ start sampling the event loop's lag, refusing new connections while
+        it is over `settings.lag_reject_threshold` seconds and closing the
+        lowest priority ones while it is over `settings.lag_shed_threshold`.
+        `settings.lag_shed_count` connections, 1 by default, are closed each
+        `settings.lag_sample_interval` seconds (0.1 by default) until the lag
+        falls.
+        """
+        if self.monitor is not None:
+            self.monitor.stop()
+        self.monitor = LagMonitor(
+            interval=self.settings.get("lag_sample_interval") or 0.1,
+            reject_above=self.settings.get("lag_reject_threshold"),
+            shed_above=self.settings.get("lag_shed_threshold"),
+            on_sample=self._on_lag_sample,
+            loop=loop
+            ).start()
+        return self.monitor
+
+    def stop_monitor(self):
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+
+    def _on_lag_sample(self, monitor):
+        if monitor.shedding:
+            self.shed(self.settings.get("lag_shed_count") or 1)
+
+    def shed(self, count):
+        """ close up to `count` open connections with code 1013, the lowest
+        priority and most recently opened first. returns the websockets being
+        closed.
+        """
+        candidates = [ws for ws in reversed(list(self._priorities))
+                      if ws.open]
+        candidates.sort(key=self._priorities.__getitem__)  # stable, newest first
+        shed = candidates[:count]
+        for ws in shed:
+            del self._priorities[ws]  # so it is not picked again
+            _msg = "{0} -> shedding, loop lag {1:.3f}s".format(
+                ws, self.monitor.lag if self.monitor is not None else 0)
+            self.logger.info(_msg)
+            ensure_future(ws.close(code=1013, reason="server overloaded"))
+        return shed
+
+    def connection_counts(self):
+        """ the number of open connections, overall and for each route, how
+        many have been turned away by `settings.max_connections` or
+        `settings.max_connections_per_route`, and how many because the event
+        loop lagged past `settings.lag_reject_threshold`.
+
+        ::
+
+            {"total": 12, "rejected": 3, "lag_rejected": 1,
+             "routes": {"/chat/{room}": 12}}
+
+        routes are keyed by their full path, including the prefixes of the
+        routers they are mounted under, and so is a
+        `settings.max_connections_per_route` dict.
+        """
+        return {
+            "total": len(self._connections),
+            "rejected": self._rejected,
+            "lag_rejected": self._lag_rejected,
+            "routes": {path: count for path, count in
+                       self._route_counts.items() if count},
+            }
+
+    @property
+    def pipeline(self):
+        """ the middleware pipeline, compiled from `settings.middleware` the
+        first time it is needed.
+        """
+        if self._pipeline is None:
+            self.reload_middleware()
+        return self._pipeline
+
+    def pipeline_for(self, stack):
+        """ return the compiled pipeline for a route's middleware stack, None
+        being the stack in `settings.middleware`.
+        """
+        if stack is None:
+            return self.pipeline
+        pipeline = self._pipelines.get(stack)
+        if pipeline is None:
+            pipeline = Pipeline.from_paths(stack, stats=self._middleware_stats)
+            self._pipelines[stack] = pipeline
+        return pipeline
+
+    def reload_middleware(self):
+        """ recompile the middleware pipelines, for when `settings.middleware`
+        has changed.
+        """
+        self._pipeline = Pipeline.from_settings(stats=self._middleware_stats)
+        self._pipelines = {}
+        for stack in self.router.stacks():
+            self.pipeline_for(stack)
+        return self._pipeline
+
+    def enable_middleware_stats(self):
+        """ time the middleware hooks of every connection opened from now on.
+        connections that are already open keep the pipeline they were bound
+        to and are not measured, nor are they once stats are disabled again.
+        untimed pipelines pay nothing for them.
+        """
+        if self._middleware_stats is None:
+            self._middleware_stats = PipelineStats()
+            self.reload_middleware()
+        return self._middleware_stats
+
+    def disable_middleware_stats(self):
+        if self._middleware_stats is not None:
+            self._middleware_stats = None
+            self.reload_middleware()
+
+    def middleware_stats(self):
+        """ return the call count, cumulative time and latency histogram of each
+        middleware and direction, or None if stats are not enabled.
+
+        ::
 
+            {"yawf.middlewares.core.JSONMiddleware": {
+                "recv": {"calls": 10, "total": 0.0002, "mean": 0.00002,
+                         "histogram": [(1e-05, 4), (2e-05, 6), ...]},
+                "send": {...}}}
+        """
+        if self._middleware_stats is None:
+            return None
+        return self._middleware_stats.snapshot()
+
+    @asyncio.coroutine
+    def run_middlewares(self, message, *, on="recv"):
+        message = yield from self.pipeline.run(message, on=on)
         return message
 
-    def run(self, host, port, *, debug=False, loop=None):
+    def run(self, host, port, *, debug=False, loop=None, workers=None,
+            handoff=None):
+        """ serve the app until interrupted. with more than one worker, from
+        the argument or `settings.workers`, the listening socket is shared
+        between that many forked processes, see `yawf.workers`. when
+        `settings.channel_broker` is set, the channel broker runs in a process
+        of its own alongside them.
+
+        `loop` is either an event loop to run on or the name of an event loop
+        policy to install, `"uvloop"` or `"asyncio"`, defaulting to
+        `settings.event_loop`. workers each create a loop of their own after
+        forking, so they only accept a policy name.
+
+        with a `handoff` unix socket path, or `settings.handoff_socket`, the
+        listening socket is taken over from the server at that path if there
+        is one, and is passed on to the next server started with it, see
+        `yawf.handoff`.
+        """
         self.debug = debug
+        handoff = handoff or self.settings.get("handoff_socket")
+        workers = workers or self.settings.get("workers") or 1
+        if workers > 1 and not (loop is None or isinstance(loop, str)):
+            raise ValueError("an event loop cannot be shared with forked"
+                " workers, pass the name of an event loop policy instead")
+        policy = "asyncio"
+        if loop is None or isinstance(loop, str):
+            policy = use_event_loop(loop or self.settings.get("event_loop"))
+            loop = None
+        self.router.freeze()
+        revocations = self.settings.get("token_revocation_file")
+        if revocations is not None:
+            BaseHandler.AUTH.load_revocations(revocations)
+        if self.settings.get("middleware_stats", False) and\
+                self._middleware_stats is None:
+            self._middleware_stats = PipelineStats()
+        self.reload_middleware()
+
+        if workers > 1:
+            return self._run_workers(host, port, int(workers), handoff)
+
+        if loop is None and policy != "asyncio":
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
         loop = loop if loop else asyncio.get_event_loop()
-        server = serve(self.as_handler(loop=loop), host, port, klass=WebSocket)
+        if handoff is None:
+            server = serve(self.as_handler(loop=loop), host, port,
+                           klass=WebSocket)
+        else:
+            sock = self._listen(host, port, handoff)
+            server = serve(self.as_handler(loop=loop), sock=sock,
+                           klass=WebSocket)
+            listener = HandoffListener(handoff, sock, ft.partial(
+                loop.call_soon_threadsafe, self._stop_for_handoff, loop)).start()
+        print("Websocket server started -> {0}:{1}\n"
+            "Press <Ctrl-c> to stop...".format(host, port))
+        try:
+            self._serve_forever(loop, server)
+        finally:
+            if handoff is not None:
+                listener.close()
+                sock.close()
+        print("OKAY BYE!")
+
+    def _listen(self, host, port, handoff=None):
+        """ the listening socket handed off by the previous server, or a newly
+        bound one.
+        """
+        sock = None
+        if handoff is not None:
+            sock = receive_socket(handoff)
+            if sock is not None:
+                _msg = "took over the listening socket from {}".format(handoff)
+                self.logger.info(_msg)
+        if sock is None:
+            sock = bind_socket(host, port,
+                reuse_port=self.settings.get("reuse_port", False))
+        return sock
+
+    def _run_workers(self, host, port, workers, handoff=None):
+        sock = self._listen(host, port, handoff)
+        targets = [ft.partial(self._run_worker, sock)] * workers
+        broker = self.settings.get("channel_broker")
+        if broker is not None:
+            from .broker import main as run_broker
+            targets.insert(0, ft.partial(run_broker, broker))
+
+        print("Websocket server started -> {0}:{1} with {2} workers\n"
+            "Press <Ctrl-c> to stop...".format(host, port, workers))
+        supervisor = Supervisor(targets)
+        listener = None
+        if handoff is not None:
+            listener = HandoffListener(
+                handoff, sock, supervisor.handoff).start()
+        try:
+            supervisor.run()
+        finally:
+            if listener is not None:
+                listener.close()
+            sock.close()
+        print("OKAY BYE!")
+
+    def _run_worker(self, sock):  # pragma: no cover
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = serve(self.as_handler(loop=loop), sock=sock, klass=WebSocket)
+        self._serve_forever(loop, server)
+
+    @staticmethod
+    def _on_signals(loop, callback):
+        """ call `callback` on SIGINT or SIGTERM, or stop handling them when it
+        is None.
+        """
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                if callback is None:
+                    loop.remove_signal_handler(signum)
+                else:
+                    loop.add_signal_handler(signum, callback)
+            except (NotImplementedError, RuntimeError):  # pragma: no cover
+                pass  # not available on this platform or thread
 
+    def _stop_for_handoff(self, loop):
+        self.handed_off = True
+        loop.stop()
+
+    def _serve_forever(self, loop, server):
+        self._on_signals(loop, loop.stop)
+        try:
+            # sent to workers by their supervisor once it has handed off
+            loop.add_signal_handler(
+                HANDOFF_SIGNAL, self._stop_for_handoff, loop)
+        except (NotImplementedError, RuntimeError):  # pragma: no cover
+            pass
+        listener = None
         try:
-            print("Websocket server started -> {0}:{1}\n"
-                "Press <Ctrl-c> to stop...".format(host, port))
-            loop.run_until_complete(server)
+            listener = loop.run_until_complete(server)
+            if self.settings.get("lag_reject_threshold") is not None or\
+                    self.settings.get("lag_shed_threshold") is not None:
+                self.start_monitor(loop=loop)
             loop.run_forever()
         except KeyboardInterrupt:  # pragma: no cover
-            print("Shutting down the server...")
+            pass
         finally:
-            server.close()
+            print("Shutting down the server...")
+            self.stop_monitor()
+            if listener is not None:
+                drain = ensure_future(
+                    self.shutdown(listener, handoff=self.handed_off),
+                    loop=loop)
+                # a second signal skips the rest of the drain
+                self._on_signals(loop, drain.cancel)
+                try:
+                    loop.run_until_complete(drain)
+                except asyncio.CancelledError:  # pragma: no cover
+                    print("Drain skipped")
+            else:
+                server.close()
+            self._on_signals(loop, None)
+            try:
+                loop.remove_signal_handler(HANDOFF_SIGNAL)
+            except (NotImplementedError, RuntimeError):  # pragma: no cover
+                pass
+            self.handed_off = False
             loop.close()
-            print("OKAY BYE!")
+
+    @asyncio.coroutine
+    def shutdown(self, server=None, *, timeout=None, handoff=False):
+        """ drain the app's connections. the server stops accepting new ones,
+        every open websocket is sent a close frame with code 1001 (going away)
+        and handlers are given `timeout` seconds, `settings.shutdown_timeout`
+        or 10 by default, to return before they are cancelled.
+
+        with `handoff`, when a new server has taken over the listening socket,
+        only the listening socket is closed and the close frames are spread
+        over `settings.handoff_stagger` seconds, 10 by default, so that
+        clients move to the new server a few at a time rather than all at
+        once. connections that finish in the meantime are left alone.
+        """
+        if timeout is None:
+            timeout = self.settings.get("shutdown_timeout")
+            timeout = 10 if timeout is None else timeout
+
+        self.draining = True
+        try:
+            if server is not None:
+                if handoff:
+                    # the websockets server closes its connections as well
+                    getattr(server, "server", server).close()
+                else:
+                    server.close()
+
+            connections = list(self._connections.items())
+            pending = set(task for _, task in connections
+                          if task is not None and not task.done())
+            stagger = 0
+            if handoff and connections:
+                stagger = self.settings.get("handoff_stagger")
+                stagger = 10 if stagger is None else stagger
+                stagger /= len(connections)
+            for ws, _ in connections:
+                if ws.open:
+                    pending.add(ensure_future(
+                        ws.close(code=1001, reason="server shutting down")))
+                if stagger:
+                    yield from asyncio.sleep(stagger)
+
+            if pending:
+                _msg = "draining {} connections".format(len(connections))
+                self.logger.info(_msg)
+                _, pending = yield from asyncio.wait(pending, timeout=timeout)
+            if pending:
+                for task in pending:
+                    task.cancel()
+                yield from asyncio.wait(pending)
+
+            if server is not None:
+                if handoff:
+                    server.close()  # its connections are all gone by now
+                try:
+                    yield from asyncio.wait_for(server.wait_closed(), timeout)
+                except asyncio.TimeoutError:  # pragma: no cover
+                    pass
+        finally:
+            self.draining = False
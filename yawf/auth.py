@@ -1,13 +1,44 @@
+import asyncio
+import collections
 import datetime
+import functools as ft
+import hashlib
+import heapq
+import time
+import uuid
 
 import jwt
 
 from yawf.conf import settings
+from yawf.revocation import RevocationList
 
 
 class JWTTokenAuth:
     """ a wrapper class around some jwt methods
+
+    verified payloads are cached, keyed by a digest of the token, until the
+    token's `exp` time so that validating the same token again is a dict
+    lookup. the cache is shared by every instance and is emptied when
+    `settings.secret_key` changes.
+
+    signing and verifying can be expensive with RSA or EC keys, the `acreate`,
+    `arefresh` and `avalidate` coroutines run them in an executor instead of on
+    the event loop. the executor is the one given to the instance, then
+    `settings.auth_executor`, then the loop's default executor.
+
+    tokens are created with a `jti` claim, a token whose `jti` has been revoked
+    no longer validates.
     """
+    cache_size = 4096
+    revoked = RevocationList()
+
+    _cache = collections.OrderedDict()  # digest -> (payload, exp)
+    _expiry = []  # heap of (exp, digest)
+    _cache_secret = None
+
+    def __init__(self, *, executor=None):
+        self.executor = executor
+
     def create(self, **payload):
         dur = settings.get("token_valid_duration") or datetime.timedelta(hours=1)
         now = datetime.datetime.utcnow()
@@ -16,6 +47,7 @@ class JWTTokenAuth:
             "exp": exp,
             "iat": now
             })
+        payload.setdefault("jti", uuid.uuid4().hex)
         return jwt.encode(payload, settings.secret_key)
 
     def refresh(self, token):
@@ -28,10 +60,138 @@ class JWTTokenAuth:
             return self.create(**payload)
         raise jwt.ExpiredSignatureError("Signature has expired")
 
+    @classmethod
+    def validate(cls, token):
+        digest, payload = cls._lookup(token)
+        if payload is None:
+            payload = cls._decode(token, settings.secret_key)
+            if payload is None:
+                return None
+            cls._remember(digest, payload)
+        return cls._accept(payload)
+
+    @classmethod
+    def revoke(cls, jti):
+        """ revoke the token with the `jti` claim given.
+        """
+        cls.revoked.add(jti)
+
+    @classmethod
+    def load_revocations(cls, path):
+        """ revoke every `jti` listed, one per line, in the file at path.
+        """
+        return cls.revoked.load(path)
+
+    @asyncio.coroutine
+    def acreate(self, **payload):
+        token = yield from self._run_in_executor(ft.partial(self.create, **payload))
+        return token
+
+    @asyncio.coroutine
+    def arefresh(self, token):
+        validated = yield from self.avalidate(token)
+        if validated is not None:
+            token = yield from self.acreate(
+                username=validated["username"], pk=validated["pk"])
+            return token
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    @asyncio.coroutine
+    def avalidate(self, token):
+        """ like `validate`, verifying tokens that are not cached in the
+        executor.
+        """
+        digest, payload = self._lookup(token)
+        if payload is None:
+            payload = yield from self._run_in_executor(
+                self._decode, token, settings.secret_key)
+            if payload is None:
+                return None
+            self._remember(digest, payload)
+        return self._accept(payload)
+
+    @asyncio.coroutine
+    def _run_in_executor(self, fn, *args):
+        executor = self.executor
+        if executor is None:
+            executor = settings.get("auth_executor")
+        loop = asyncio.get_event_loop()
+        result = yield from loop.run_in_executor(executor, fn, *args)
+        return result
+
+    @classmethod
+    def _accept(cls, payload):
+        jti = payload.get("jti")
+        if jti is not None and cls.revoked and jti in cls.revoked:
+            return None
+        return dict(payload)
+
     @staticmethod
-    def validate(token):
+    def _decode(token, secret):
         try:
-            token = jwt.decode(token, settings.secret_key)
-            return token
+            return jwt.decode(token, secret)
         except jwt.ExpiredSignatureError:
             return None
+
+    @classmethod
+    def _lookup(cls, token):
+        """ return the token's digest and its cached payload, if any.
+        """
+        secret = settings.secret_key
+        if secret != cls._cache_secret:
+            cls.clear_cache()
+            cls._cache_secret = secret
+
+        now = time.time()
+        cls._expire(now)
+        digest = cls._digest(token)
+        cached = cls._cache.get(digest)
+        if cached is not None:
+            payload, exp = cached
+            if exp is None or now < exp:
+                cls._cache.move_to_end(digest)
+                return digest, payload
+            del cls._cache[digest]
+        return digest, None
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+        del cls._expiry[:]
+
+    @staticmethod
+    def _digest(token):
+        if isinstance(token, str):
+            token = token.encode("utf-8")
+        return hashlib.sha256(token).digest()
+
+    @classmethod
+    def _remember(cls, digest, payload):
+        exp = payload.get("exp")
+        cls._cache[digest] = payload, exp
+        if exp is not None:
+            heapq.heappush(cls._expiry, (exp, digest))
+        if len(cls._cache) > cls.cache_size:
+            cls._cache.popitem(last=False)
+        if len(cls._expiry) > 2 * cls.cache_size:
+            cls._compact()
+
+    @classmethod
+    def _compact(cls):
+        """ rebuild the expiry heap from the cache, dropping the entries left
+        behind by evicted and revalidated tokens.
+        """
+        cls._expiry[:] = [(exp, digest) for digest, (_, exp)
+                          in cls._cache.items() if exp is not None]
+        heapq.heapify(cls._expiry)
+
+    @classmethod
+    def _expire(cls, now):
+        """ drop the cached payloads whose tokens have expired.
+        """
+        expiry, cache = cls._expiry, cls._cache
+        while expiry and expiry[0][0] <= now:
+            exp, digest = heapq.heappop(expiry)
+            cached = cache.get(digest)
+            if cached is not None and cached[1] == exp:
+                del cache[digest]
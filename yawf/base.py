@@ -9,6 +9,8 @@ except ImportError:  # pragma: no cover
 import asyncio
 
 from . import auth
+from .channels import get_channel_layer
+from .protocol import broadcast
 
 
 class BaseHandler(ABC):
@@ -18,6 +20,8 @@ class BaseHandler(ABC):
 
     send_schema = None
     recv_schema = None
+    middleware = None  # import paths used instead of settings.middleware
+    priority = 0  # lower priority connections are shed first under load
 
     __slots__ = ("websockets",)
 
@@ -42,11 +46,32 @@ class BaseHandler(ABC):
         except KeyError:  # pragma: no cover
             pass
 
+    @asyncio.coroutine
+    def broadcast(self, message, *, exclude=()):
+        """ send a message to every connected client except those in
+        `exclude`. the message is encoded once and written to all clients
+        concurrently, clients found to be closed are removed.
+        """
+        websockets = [ws for ws in self.websockets if ws not in exclude]
+        closed = yield from broadcast(websockets, message)
+        for ws in closed:
+            self.remove_websocket(ws)
+        return len(websockets) - len(closed)
+
+    @property
+    def channels(self):
+        """ the channel layer, for subscribing clients to groups.
+        """
+        return get_channel_layer()
+
     @asyncio.coroutine
     def __call__(self, ws, **kwargs):
         self.add_websocket(ws)  # add this websocket to the set of connections
-        yield from self.handle(ws, **kwargs)
-        self.remove_websocket(ws)  # remove this websocket form the set
+        try:
+            yield from self.handle(ws, **kwargs)
+        finally:
+            self.remove_websocket(ws)  # remove this websocket form the set
+            self.channels.discard(ws)  # and from any channel groups
         return ws
 
     @asyncio.coroutine
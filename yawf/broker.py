@@ -0,0 +1,284 @@
+"""
+.. module:: yawf.broker
+
+a channel layer shared by the server processes on one host. each process
+connects to a broker listening on a unix domain socket, and the broker relays
+every published message to the other processes, which deliver it to their own
+subscribers.
+
+.. code-block:: python
+    :caption: settings.py
+
+    s.channel_layer = "yawf.broker.BrokerChannelLayer"
+    s.channel_broker = "/tmp/yawf-channels.sock"
+
+the broker itself runs in its own process, or alongside the workers in the
+supervising process.
+
+.. code-block:: bash
+
+    $ python -m yawf.broker /tmp/yawf-channels.sock
+
+frames are length prefixed and written in batches, whatever has queued up
+since the last write going out in one call. the buffers on either side are
+bounded, dropping the oldest frames when a peer falls behind.
+"""
+import asyncio
+import collections
+import logging
+import os
+import struct
+
+from yawf.conf import settings
+from .channels import ChannelLayer
+from .compatibility import ensure_future
+from .serializers import get_serializer
+
+__all__ = ("Broker", "BrokerChannelLayer", "FrameWriter")
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "/tmp/yawf-channels.sock"
+HEADER = struct.Struct("!I")
+
+
+@asyncio.coroutine
+def read_frame(reader):
+    header = yield from reader.readexactly(HEADER.size)
+    size, = HEADER.unpack(header)
+    frame = yield from reader.readexactly(size)
+    return frame
+
+
+class FrameWriter:
+    """ a bounded buffer of frames for a stream, written by a task that sends
+    every frame queued since its last write in one go. frames can be queued
+    before a stream is attached.
+    """
+    def __init__(self, writer=None, *, maxsize=1024, loop=None):
+        self.maxsize = maxsize
+        self.sent = self.dropped = 0
+        self.writer = None
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._frames = collections.deque()
+        self._waiter = None
+        self._task = None
+        if writer is not None:
+            self.attach(writer)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame):
+        if len(self._frames) >= self.maxsize:
+            self._frames.popleft()
+            self.dropped += 1
+        self._frames.append(HEADER.pack(len(frame)) + frame)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def attach(self, writer):
+        self.detach()
+        self.writer = writer
+        self._task = ensure_future(self._drain(writer), loop=self._loop)
+
+    def detach(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    @asyncio.coroutine
+    def _drain(self, writer):
+        try:
+            while True:
+                if not self._frames:
+                    self._waiter = asyncio.Future(loop=self._loop)
+                    yield from self._waiter
+                    self._waiter = None
+                    continue
+                count = len(self._frames)
+                writer.write(b"".join(self._frames))
+                self._frames.clear()
+                self.sent += count
+                yield from writer.drain()
+        except (ConnectionError, OSError):
+            pass  # the reading side notices the stream is gone
+
+
+class Broker:
+    """ relays frames from each connected process to all of the others.
+    """
+    def __init__(self, path=None, *, maxsize=1024):
+        self.path = path if path is not None else\
+            settings.get("channel_broker", DEFAULT_PATH)
+        self.maxsize = maxsize
+        self.peers = set()
+        self.server = None
+
+    def __str__(self):
+        return "<{0} :: {1} Peers={2}>".format(
+            self.__class__.__name__, self.path, len(self.peers))
+    __repr__ = __str__
+
+    @asyncio.coroutine
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a broker that did not stop
+        self.server = yield from asyncio.start_unix_server(
+            self._serve_peer, self.path)
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for peer in list(self.peers):
+            peer.detach()
+        self.peers.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    @asyncio.coroutine
+    def wait_closed(self):
+        if self.server is not None:
+            yield from self.server.wait_closed()
+
+    @asyncio.coroutine
+    def _serve_peer(self, reader, writer):
+        peer = FrameWriter(writer, maxsize=self.maxsize)
+        self.peers.add(peer)
+        try:
+            while True:
+                frame = yield from read_frame(reader)
+                for other in self.peers:
+                    if other is not peer:
+                        other.put(frame)
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.peers.discard(peer)
+            peer.detach()
+
+
+class BrokerChannelLayer(ChannelLayer):
+    """ a channel layer publishing to this process's subscribers and, through
+    the broker at `settings.channel_broker`, to every other process's. the
+    broker connection is made the first time the layer is used and is retried
+    if it is lost, messages published in the meantime are buffered up to
+    `maxsize`.
+    """
+    retry_delay = 0.05
+    max_retry_delay = 5.0
+
+    def __init__(self, path=None, *, maxsize=1024, loop=None):
+        super().__init__()
+        self.path = path if path is not None else\
+            settings.get("channel_broker", DEFAULT_PATH)
+        self.serializer = get_serializer()
+        self.closed = False
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._out = FrameWriter(maxsize=maxsize, loop=self._loop)
+        self._task = None
+        self._connected = asyncio.Future(loop=self._loop)
+
+    def subscribe(self, group, ws):
+        self.start()
+        super().subscribe(group, ws)
+
+    def start(self):
+        """ connect to the broker in the background, if not already.
+        """
+        if self._task is None and not self.closed:
+            self._task = ensure_future(self._run(), loop=self._loop)
+
+    @asyncio.coroutine
+    def wait_connected(self):
+        self.start()
+        yield from asyncio.shield(self._connected)
+
+    def close(self):
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._out.detach()
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        """ send a message to the members of a topic in this process, and to
+        the broker for the other processes. returns the number of local
+        websockets it was written to.
+        """
+        self.start()
+        data = self.serializer.dumps([topic, message])
+        self._out.put(data.encode("utf-8"))
+        sent = yield from super().publish(topic, message)
+        return sent
+
+    @asyncio.coroutine
+    def _run(self):
+        try:
+            yield from self._connect_and_read()
+        finally:
+            self._task = None  # so that `start` can run it again
+
+    @asyncio.coroutine
+    def _connect_and_read(self):
+        delay = self.retry_delay
+        while not self.closed:
+            try:
+                reader, writer = yield from asyncio.open_unix_connection(
+                    self.path)
+            except OSError:
+                yield from asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            delay = self.retry_delay
+            self._out.attach(writer)
+            if not self._connected.done():
+                self._connected.set_result(True)
+            try:
+                while True:
+                    frame = yield from read_frame(reader)
+                    yield from self._deliver(frame)
+            except (EOFError, OSError):
+                pass
+            finally:
+                self._out.detach()
+                self._connected = asyncio.Future(loop=self._loop)
+
+    @asyncio.coroutine
+    def _deliver(self, frame):
+        """ publish a frame from the broker to this process's subscribers. a
+        frame that cannot be delivered is logged and skipped.
+        """
+        try:
+            topic, message = self.serializer.loads(frame.decode("utf-8"))
+            yield from super().publish(topic, message)
+        except Exception:
+            logger.exception("could not deliver a message from the channel"
+                " broker")
+
+
+def main(path=None):  # pragma: no cover
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    broker = loop.run_until_complete(Broker(path).start())
+    print("Channel broker started -> {0}\n"
+        "Press <Ctrl-c> to stop...".format(broker.path))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+        loop.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import sys
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,115 @@
+"""
+.. module:: yawf.channels
+
+a channel layer groups connections under names so that a message can be
+published to just the members of a group. group names are dotted topics, and
+subscribing to `chat.*` receives everything published under `chat.`.
+
+.. code-block:: python
+
+    from yawf.channels import get_channel_layer
+
+    channels = get_channel_layer()
+    channels.subscribe("chat.room1", ws)
+    yield from channels.publish("chat.room1", {"message": "hello"})
+
+membership is dropped automatically when a `BaseHandler` connection closes.
+"""
+import asyncio
+import importlib
+
+from yawf.conf import settings
+from .protocol import broadcast
+
+__all__ = ("ChannelLayer", "get_channel_layer")
+
+
+class ChannelLayer:
+    """ an in-process channel layer.
+    """
+    wildcard = "*"
+
+    def __init__(self):
+        self.groups = {}  # group name -> set of websockets
+        self.memberships = {}  # websocket -> set of group names
+        self._wildcards = 0
+
+    def __str__(self):
+        return "<{0} :: Groups={1}>".format(
+            self.__class__.__name__, len(self.groups))
+    __repr__ = __str__
+
+    def subscribe(self, group, ws):
+        members = self.groups.setdefault(group, set())
+        if ws not in members:
+            members.add(ws)
+            self.memberships.setdefault(ws, set()).add(group)
+            if len(members) == 1 and group.endswith(self.wildcard):
+                self._wildcards += 1
+
+    def unsubscribe(self, group, ws):
+        members = self.groups.get(group)
+        if members is None or ws not in members:
+            return
+        members.remove(ws)
+        if not members:
+            del self.groups[group]
+            if group.endswith(self.wildcard):
+                self._wildcards -= 1
+        groups = self.memberships.get(ws)
+        if groups is not None:
+            groups.discard(group)
+            if not groups:
+                del self.memberships[ws]
+
+    def discard(self, ws):
+        """ remove a websocket from every group it belongs to.
+        """
+        for group in list(self.memberships.get(ws, ())):
+            self.unsubscribe(group, ws)
+
+    def members(self, topic):
+        """ the websockets subscribed to a topic, directly or through a
+        wildcard.
+        """
+        members = self.groups.get(topic, ())
+        if not self._wildcards:
+            return members
+
+        members = set(members)
+        prefix = ""
+        for part in topic.split(".")[:-1]:
+            prefix += part + "."
+            members.update(self.groups.get(prefix + self.wildcard, ()))
+        return members
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        """ send a message to the members of a topic, encoding it once. returns
+        the number of websockets it was written to.
+        """
+        members = list(self.members(topic))
+        if not members:
+            return 0
+        closed = yield from broadcast(members, message)
+        for ws in closed:
+            self.discard(ws)
+        return len(members) - len(closed)
+
+
+_layer = None
+
+
+def get_channel_layer():
+    """ return the process's channel layer, an instance of the class at the
+    import path in `settings.channel_layer`, or a `ChannelLayer`.
+    """
+    global _layer
+    if _layer is None:
+        path = settings.get("channel_layer")
+        if path is None:
+            _layer = ChannelLayer()
+        else:
+            module, klass = path.rsplit(".", 1)
+            _layer = getattr(importlib.import_module(module), klass)()
+    return _layer
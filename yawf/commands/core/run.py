@@ -1,3 +1,4 @@
+from yawf.compatibility import EVENT_LOOPS
 from .. import BaseCommand
 
 
@@ -15,11 +16,33 @@ class Command(BaseCommand):
             "--port",
             default="8756"
             )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="the number of worker processes to fork."
+            )
+        parser.add_argument(
+            "--loop",
+            choices=EVENT_LOOPS,
+            default=None,
+            help="the event loop to run on."
+            )
+        parser.add_argument(
+            "--handoff-socket",
+            default=None,
+            help="a unix socket path to take the listening socket over from"
+                 " a running server through, and to pass it on through to"
+                 " the next one."
+            )
 
     def handle(self, options):
         debug = self.app.settings.get("debug", True)
         self.app.run(
             options.host,
             options.port,
-            debug=debug
+            debug=debug,
+            workers=options.workers,
+            loop=options.loop,
+            handoff=options.handoff_socket
             )
@@ -1,12 +1,10 @@
-import datetime
 import sys
+import asyncio
 import functools as ft
+import logging
 from glob import iglob
 
-try:
-    import ujson as json
-except ImportError:  # pragma: no cover
-    import json as json
+from .serializers import get_serializer
 
 try:
     from asyncio import ensure_future
@@ -14,7 +12,8 @@ except ImportError:  # pragma: no cover
     from asyncio import async as ensure_future
 
 
-__all__ = ("yayson", "ensure_future", "PY35", "iglob")
+__all__ = ("yayson", "ensure_future", "current_task", "PY35", "iglob",
+           "use_event_loop")
 
 
 PY35 = sys.version_info.minor > 4
@@ -22,14 +21,40 @@ PY35 = sys.version_info.minor > 4
 if PY35:
     iglob = ft.partial(iglob, recursive=True)
 
-yayson = json
+# ujson if it is installed, the json module otherwise. see `yawf.serializers`
+# for choosing a serializer through settings.
+yayson = get_serializer("auto")
 
-def _default(obj):  # pragma: no cover
-    if isinstance(obj, datetime.datetime):
-        return obj.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-    elif isinstance(obj, bytes):
-        return obj.decode("utf-8")
+ensure_future = ensure_future
 
-yayson.dumps = ft.partial(yayson.dumps, default=_default)
 
-ensure_future = ensure_future
+def current_task(loop=None):
+    """ the task running on `loop`, asyncio.current_task where it exists and
+    Task.current_task before python 3.7.
+    """
+    if hasattr(asyncio, "current_task"):
+        return asyncio.current_task(loop)
+    return asyncio.Task.current_task(loop)  # pragma: no cover
+
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+def use_event_loop(name):
+    """ install the event loop policy called `name`, one of `EVENT_LOOPS`,
+    returning the name of the one in use. when uvloop is asked for but is not
+    installed the default policy is kept.
+    """
+    if name is None or name == "asyncio":
+        return "asyncio"
+    if name not in EVENT_LOOPS:
+        raise ValueError("unknown event loop {0}, choose one of"
+            " {1}".format(name, EVENT_LOOPS))
+    try:
+        import uvloop
+    except ImportError:
+        logging.getLogger(__name__).warning(
+            "uvloop is not installed, using the default event loop")
+        return "asyncio"
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
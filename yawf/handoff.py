@@ -0,0 +1,128 @@
+"""
+.. module:: yawf.handoff
+
+zero downtime restarts. a server started with a handoff socket listens on that
+unix socket for its successor. a new server started with the same handoff
+socket connects to it and is passed the listening socket's file descriptor
+(with `SCM_RIGHTS`), so it serves new clients straight away while the old
+server stops accepting and drains the connections it already has.
+
+.. code-block:: bash
+
+    $ yawf run --handoff-socket /tmp/yawf-handoff.sock &
+    # deploy, then start the new version the same way
+    $ yawf run --handoff-socket /tmp/yawf-handoff.sock
+
+when nothing is listening on the handoff socket the new server binds its own
+listening socket as usual. the old server's clients are then closed a few at a
+time rather than all at once, see `App.shutdown`.
+"""
+import array
+import os
+import signal
+import socket
+import threading
+
+__all__ = ("HANDOFF_SIGNAL", "HandoffError", "HandoffListener",
+           "receive_socket")
+
+
+# tells a worker that its listening socket has been handed off
+HANDOFF_SIGNAL = signal.SIGUSR1
+
+
+class HandoffError(Exception):
+    """ raised when the process at a handoff socket does not pass on a
+    listening socket.
+    """
+
+
+def receive_socket(path, *, timeout=5.0):
+    """ ask the server listening at `path` for its listening socket, returning
+    None if there is no server there.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+
+    fds = array.array("i")
+    with client:
+        msg, ancdata, _, _ = client.recvmsg(
+            16, socket.CMSG_LEN(fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    if not fds or not msg:
+        raise HandoffError("{0} did not pass on a socket".format(path))
+
+    sock = socket.fromfd(fds[0], int(msg), socket.SOCK_STREAM)
+    for fd in fds:
+        os.close(fd)
+    sock.setblocking(False)
+    return sock
+
+
+class HandoffListener:
+    """ waits on a unix socket, in a thread of its own, for a new server to
+    ask for `sock`. once the socket has been passed on `on_handoff` is called,
+    from that thread, to have this server stop accepting and drain.
+    """
+    poll_interval = 0.5
+
+    def __init__(self, path, sock, on_handoff):
+        self.path = path
+        self.sock = sock
+        self.on_handoff = on_handoff
+        self.handed_off = False
+        self.closed = False
+        self._listener = None
+        self._thread = None
+
+    def __str__(self):
+        return "<{0} :: {1}>".format(self.__class__.__name__, self.path)
+    __repr__ = __str__
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by the server handing off to us
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(1)
+        self._listener.settimeout(self.poll_interval)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """ stop listening, removing the handoff socket unless a successor has
+        already taken it over.
+        """
+        self.closed = True
+        if self._thread is not None and\
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._listener is not None:
+            self._listener.close()
+        if not self.handed_off and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _serve(self):
+        while not self.closed:
+            try:
+                conn, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:  # pragma: no cover
+                return
+            with conn:
+                fds = array.array("i", [self.sock.fileno()])
+                conn.sendmsg(
+                    [str(int(self.sock.family)).encode("ascii")],
+                    [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+            self.handed_off = self.closed = True
+            self.on_handoff()
+            return
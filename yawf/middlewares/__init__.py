@@ -1 +1,2 @@
-from .middleware import Middleware
+from .middleware import Middleware, ConnectionRefused
+from .pipeline import Pipeline, BoundPipeline
@@ -1,41 +1,100 @@
 import asyncio
 from datetime import datetime
+import time
 
-from yawf.compatibility import yayson
+import jwt
+
+from yawf.serializers import get_serializer
 from yawf.auth import JWTTokenAuth
-from .middleware import Middleware
+from .middleware import ConnectionRefused, Middleware
 
 
 class JSONMiddleware(Middleware):
     """
     - load all recieved messages as json
     - dump all sent messages as json
+
+    using the serializer chosen with `settings.serializer`.
     """
-    @asyncio.coroutine
+    def __init__(self, websocket=None):
+        super().__init__(websocket)
+        self.serializer = get_serializer()
+
     def on_send(self, message):
-        message = yayson.dumps(message)
+        message = self.serializer.dumps(message)
         return message
 
-    @asyncio.coroutine
     def on_recv(self, message):
-        message = yayson.loads(message)
+        message = self.serializer.loads(message)
         return message
 
 
 class JWTMiddleware(Middleware):
     """ relies on JSONMiddleware
+
+    a connection is authenticated once, from the `token` query parameter while
+    the connection opens or from the first message with an `authentication`
+    key, and the identity is kept on the websocket as `auth_user`. an invalid
+    query token refuses the connection before its handler starts. the token is
+    only validated again when a message carries a different one or when its
+    `exp` claim has passed, but every message checks that its `jti` has not
+    been revoked since. verification runs in the validator's executor, off
+    the event loop.
     """
     validator = JWTTokenAuth()
+    query_param = "token"
+
+    def __init__(self, websocket=None):
+        super().__init__(websocket)
+        self.token = None
+        self.identity = None
+        self.expires = None
+
+    @asyncio.coroutine
+    def authenticate(self, token):
+        """ validate `token` and remember it along with its identity. a token
+        that does not validate is not remembered, it only clears the current
+        identity when it is the current token, i.e. once that has expired.
+        """
+        identity = yield from self.validator.avalidate(token)
+        if identity is None and token != self.token:
+            return None
+        self.token = token if identity is not None else None
+        self.identity = identity
+        self.expires = None if identity is None else identity.get("exp")
+        if self.websocket is not None:
+            self.websocket.auth_user = identity
+        return identity
+
+    @asyncio.coroutine
+    def on_open(self, query):
+        tokens = query.get(self.query_param)
+        if tokens:
+            try:
+                identity = yield from self.authenticate(tokens[0])
+            except jwt.InvalidTokenError:
+                identity = None
+            if identity is None:
+                raise ConnectionRefused("invalid token")
 
     @asyncio.coroutine
     def on_recv(self, message):
-        auth_user = message.pop("authentication", None)
-        if auth_user:
-            auth_user = self.validator.validate(auth_user)
-        message["auth_user"] = auth_user
+        token = message.pop("authentication", None)
+        if token and token != self.token:
+            yield from self.authenticate(token)
+        elif self.expires is not None and self.expires <= time.time():
+            yield from self.authenticate(self.token)
+        elif self.identity is not None and self._revoked(self.identity):
+            self.token = self.identity = self.expires = None
+            if self.websocket is not None:
+                self.websocket.auth_user = None
+        message["auth_user"] = self.identity
         return message
 
-    @asyncio.coroutine
+    def _revoked(self, identity):
+        revoked = self.validator.revoked
+        return bool(revoked) and identity.get("jti") in revoked
+
     def on_send(self, message):
         message.pop("auth_user", None)
         return message
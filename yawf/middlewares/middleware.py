@@ -1,3 +1,13 @@
+class ConnectionRefused(Exception):
+    """ raised by an `on_open` hook to close the connection before its handler
+    starts.
+    """
+    def __init__(self, reason="", *, code=1008):
+        super().__init__(reason)
+        self.reason = reason
+        self.code = code
+
+
 class Middleware:
     """
     .. code-block:: python
@@ -10,6 +20,22 @@ class Middleware:
         @asyncio.coroutine
         def on_send(self, message):
             return message
+
+    hooks that never need to wait on anything can be plain functions, which the
+    pipeline calls directly without a coroutine.
+
+    .. code-block:: python
+
+    class MyMiddleware(Middleware):
+        def on_recv(self, message):
+            return message
+
+    each connection gets its own instances of its middlewares, with
+    `self.websocket` set to the connection, so a middleware can keep
+    per-connection state on `self`. an optional `on_open(query)` hook, plain or
+    a coroutine, is called with the parsed query string when the connection
+    opens, before its handler starts, and can refuse the connection by raising
+    `ConnectionRefused`. an optional `on_close` hook is called when it closes.
     """
     def __init__(self, websocket=None):
         self.websocket = websocket
@@ -0,0 +1,182 @@
+import asyncio
+
+from yawf.conf import settings
+from .utils import load_middleware_class
+
+
+class Pipeline:
+    """ the middleware stack compiled into fixed call chains, one for received
+    messages and one, in reverse order, for sent messages. hooks that are not
+    coroutine functions are called directly, and a chain made up only of them
+    can be run without a coroutine at all.
+
+    a pipeline holds middleware classes, each connection binds its own
+    instances of them when it opens.
+
+    .. code-block:: python
+
+        pipeline = Pipeline.from_settings()
+        bound = pipeline.bind(websocket)
+        if bound.async_recv:
+            message = yield from bound.recv('{"foo": "bar"}')
+        else:
+            message = bound.recv_sync('{"foo": "bar"}')
+        bound.close()
+    """
+    __slots__ = ("middlewares", "stats", "async_recv", "async_send",
+                 "_recv_hooks", "_send_hooks")
+
+    def __init__(self, middlewares, *, stats=None):
+        self.middlewares = tuple(middlewares)
+        self.stats = stats
+        self._recv_hooks = self._hooks(on="recv")
+        self._send_hooks = tuple(reversed(self._hooks(on="send")))
+        self.async_recv = any(is_async for _, _, is_async in self._recv_hooks)
+        self.async_send = any(is_async for _, _, is_async in self._send_hooks)
+
+    def __str__(self):
+        return "<{0} :: {1}>".format(self.__class__.__name__,
+            [m.__name__ for m in self.middlewares])
+    __repr__ = __str__
+
+    @classmethod
+    def from_paths(cls, module_paths, *, stats=None):
+        """ build a pipeline from a list of middleware import paths.
+        """
+        middlewares = []
+        for module_path in module_paths:
+            middleware = load_middleware_class(module_path)
+            if middleware is not None:
+                middlewares.append(middleware)
+        return cls(middlewares, stats=stats)
+
+    @classmethod
+    def from_settings(cls, *, stats=None):
+        """ build a pipeline from the import paths in `settings.middleware`.
+        """
+        return cls.from_paths(settings.get("middleware") or [], stats=stats)
+
+    def _hooks(self, *, on):
+        hooks = []
+        name = "on_{}".format(on)
+        for index, middleware in enumerate(self.middlewares):
+            hook = getattr(middleware, name, None)
+            if hook is not None:
+                hooks.append((index, name, asyncio.iscoroutinefunction(hook)))
+        return tuple(hooks)
+
+    def bind(self, websocket=None):
+        """ instantiate the middlewares for a connection.
+        """
+        return BoundPipeline(self, websocket)
+
+    @asyncio.coroutine
+    def run(self, message, *, on="recv"):
+        """ run a message through instances bound for this call alone, so that
+        no middleware state carries over from one caller to the next.
+        """
+        bound = self.bind()
+        try:
+            message = yield from bound.run(message, on=on)
+        finally:
+            bound.close()
+        return message
+
+
+class BoundPipeline:
+    """ a pipeline's middlewares instantiated for one connection.
+    """
+    __slots__ = ("pipeline", "middlewares", "async_recv", "async_send",
+                 "_recv_steps", "_send_steps")
+
+    def __init__(self, pipeline, websocket=None):
+        self.pipeline = pipeline
+        self.middlewares = tuple(m(websocket) for m in pipeline.middlewares)
+        self.async_recv = pipeline.async_recv
+        self.async_send = pipeline.async_send
+        self._recv_steps = self._steps(pipeline._recv_hooks, on="recv")
+        self._send_steps = self._steps(pipeline._send_hooks, on="send")
+
+    def __str__(self):
+        return "<{0} :: {1}>".format(self.__class__.__name__,
+            [type(m).__name__ for m in self.middlewares])
+    __repr__ = __str__
+
+    def _steps(self, hooks, *, on):
+        stats = self.pipeline.stats
+        steps = []
+        for index, name, is_async in hooks:
+            middleware = self.middlewares[index]
+            routine = getattr(middleware, name)
+            if stats is not None:
+                routine = stats.wrap(routine, is_async, type(middleware), on)
+            steps.append((routine, is_async))
+        return tuple(steps)
+
+    @staticmethod
+    @asyncio.coroutine
+    def _run(steps, message):
+        for routine, is_async in steps:
+            if is_async:
+                message = yield from routine(message)
+            else:
+                message = routine(message)
+            assert message is not None, "A middleware returned an invalid message"
+        return message
+
+    @staticmethod
+    def _run_sync(steps, message):
+        for routine, _ in steps:
+            message = routine(message)
+            assert message is not None, "A middleware returned an invalid message"
+        return message
+
+    def recv(self, message):
+        return self._run(self._recv_steps, message)
+
+    def send(self, message):
+        return self._run(self._send_steps, message)
+
+    def recv_sync(self, message):
+        """ run the recv chain without a coroutine, only valid when none of its
+        hooks are coroutine functions.
+        """
+        return self._run_sync(self._recv_steps, message)
+
+    def send_sync(self, message):
+        """ run the send chain without a coroutine, only valid when none of its
+        hooks are coroutine functions.
+        """
+        return self._run_sync(self._send_steps, message)
+
+    def run(self, message, *, on="recv"):
+        if on == "send":
+            return self.send(message)
+        return self.recv(message)
+
+    @asyncio.coroutine
+    def open(self, *, query=None):
+        """ call the middlewares' optional `on_open` hooks with the query of
+        the connection's request, waiting on those that are coroutines. a hook
+        refuses the connection by raising `ConnectionRefused`.
+        """
+        query = query if query is not None else {}
+        for middleware in self.middlewares:
+            on_open = getattr(middleware, "on_open", None)
+            if on_open is None:
+                continue
+            if asyncio.iscoroutinefunction(on_open):
+                yield from on_open(query)
+            else:
+                on_open(query)
+
+    def close(self):
+        """ tear down the connection's middlewares, calling their `on_close`
+        hooks. closing twice does nothing.
+        """
+        middlewares, self.middlewares = self.middlewares, ()
+        self._recv_steps = self._send_steps = ()
+        for middleware in middlewares:
+            on_close = getattr(middleware, "on_close", None)
+            if on_close is not None:
+                on_close()
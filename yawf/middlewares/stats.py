@@ -0,0 +1,82 @@
+import asyncio
+import bisect
+import functools as ft
+from time import perf_counter
+
+
+class LatencyStats:
+    """ call count, cumulative time and a latency histogram for one middleware
+    hook. bucket `i` counts calls that took less than `BOUNDS[i]` seconds (and
+    at least the bound before it), the last bucket counts everything slower.
+    """
+    BOUNDS = tuple(0.00001 * 2 ** i for i in range(15))  # 10us .. ~164ms
+
+    __slots__ = ("calls", "total", "counts")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.counts[bisect.bisect_right(self.BOUNDS, elapsed)] += 1
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "total": self.total,
+            "mean": self.total / self.calls if self.calls else 0.0,
+            "histogram": list(zip(self.BOUNDS + (float("inf"),), self.counts)),
+            }
+
+
+class PipelineStats:
+    """ latency stats for every middleware hook in a pipeline, keyed by the
+    middleware's import path and the direction, `recv` or `send`.
+    """
+    __slots__ = ("entries",)
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, klass, on):
+        key = "{0}.{1}".format(klass.__module__, klass.__name__), on
+        if key not in self.entries:
+            self.entries[key] = LatencyStats()
+        return self.entries[key]
+
+    def snapshot(self):
+        stats = {}
+        for (name, on), entry in self.entries.items():
+            stats.setdefault(name, {})[on] = entry.as_dict()
+        return stats
+
+    def reset(self):
+        self.entries.clear()
+
+    def wrap(self, routine, is_async, klass, on):
+        """ wrap a middleware hook so that each call is timed.
+        """
+        record = self.get(klass, on).record
+
+        if is_async:
+            @ft.wraps(routine)
+            @asyncio.coroutine
+            def timed(message):
+                start = perf_counter()
+                try:
+                    message = yield from routine(message)
+                finally:
+                    record(perf_counter() - start)
+                return message
+        else:
+            @ft.wraps(routine)
+            def timed(message):
+                start = perf_counter()
+                try:
+                    return routine(message)
+                finally:
+                    record(perf_counter() - start)
+        return timed
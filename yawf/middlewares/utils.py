@@ -5,17 +5,31 @@ import importlib
 from yawf.conf import settings, make_setting
 
 
-@asyncio.coroutine
-@ft.lru_cache(maxsize=100)
-def import_middleware(module_path):
+def load_middleware_class(module_path):
+    """ import the middleware class at `module_path`, returning None if the
+    module has no such attribute.
+    """
     path, middleware = module_path.rsplit(".", 1)
     module = importlib.import_module(path)
-    middleware = getattr(module, middleware, None)
+    return getattr(module, middleware, None)
+
+
+def load_middleware(module_path):
+    """ import and instantiate the middleware at `module_path`, returning None
+    if the module has no such attribute.
+    """
+    middleware = load_middleware_class(module_path)
     if middleware is not None:
         middleware = middleware()
     return middleware
 
 
+@asyncio.coroutine
+@ft.lru_cache(maxsize=100)
+def import_middleware(module_path):
+    return load_middleware(module_path)
+
+
 @asyncio.coroutine
 def collect_middleware():
     modules = []
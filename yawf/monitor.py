@@ -0,0 +1,94 @@
+"""
+.. module:: yawf.monitor
+
+event loop lag. a callback is scheduled every `interval` seconds and the lag
+is how late the loop gets round to running it, smoothed over recent samples.
+a loop that is falling behind shows up here before clients start timing out.
+
+.. code-block:: python
+    :caption: settings.py
+
+    s.lag_reject_threshold = 0.1  # refuse new connections above 100ms of lag
+    s.lag_shed_threshold = 0.5    # and close existing ones above 500ms
+
+connections are shed lowest route `priority` first, newest first among equals,
+see `Router.route` and `BaseHandler.priority`.
+"""
+import asyncio
+
+__all__ = ("LagMonitor",)
+
+
+class LagMonitor:
+    """ samples the lag of an event loop. `on_sample` is called with the
+    monitor after every sample.
+
+    .. code-block:: python
+
+        monitor = LagMonitor(interval=0.05, reject_above=0.1).start()
+        if monitor.overloaded:
+            yield from ws.close(code=1013)
+    """
+    def __init__(self, *, interval=0.1, reject_above=None, shed_above=None,
+                 smoothing=0.5, on_sample=None, loop=None):
+        self.interval = interval
+        self.reject_above = reject_above
+        self.shed_above = shed_above
+        self.smoothing = smoothing
+        self.on_sample = on_sample
+        self.lag = self.max_lag = 0.0
+        self.samples = 0
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._handle = None
+
+    def __str__(self):
+        return "<{0} :: Lag={1:.4f}>".format(self.__class__.__name__, self.lag)
+    __repr__ = __str__
+
+    @property
+    def running(self):
+        return self._handle is not None
+
+    @property
+    def overloaded(self):
+        """ whether new connections should be refused.
+        """
+        return self.reject_above is not None and self.lag >= self.reject_above
+
+    @property
+    def shedding(self):
+        """ whether open connections should be closed.
+        """
+        return self.shed_above is not None and self.lag >= self.shed_above
+
+    def start(self):
+        if self._handle is None:
+            self._schedule()
+        return self
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def stats(self):
+        return {
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "samples": self.samples,
+            "overloaded": self.overloaded,
+            "shedding": self.shedding,
+            }
+
+    def _schedule(self):
+        expected = self._loop.time() + self.interval
+        self._handle = self._loop.call_at(expected, self._sample, expected)
+
+    def _sample(self, expected):
+        lag = max(0.0, self._loop.time() - expected)
+        self.lag = self.smoothing * lag + (1 - self.smoothing) * self.lag
+        self.max_lag = max(self.max_lag, lag)
+        self.samples += 1
+        self._schedule()
+        if self.on_sample is not None:
+            self.on_sample(self)
@@ -2,20 +2,162 @@ import asyncio
 
 from websockets.server import WebSocketServerProtocol
 
+from yawf.conf import settings
+from yawf.compatibility import ensure_future
+from yawf.queues import SendQueue
 from yawf.utils import get_app
 
 
 class WebSocket(WebSocketServerProtocol):
+    """ a websocket running messages through the app's middleware. when
+    `settings.send_queue_size` is set, frames are written through a bounded
+    `SendQueue` using `settings.send_queue_policy` (`block` by default), which
+    is flushed for up to `settings.send_queue_close_timeout` seconds (5 by
+    default) before the connection is closed.
+    """
+    pipeline = None  # the connection's bound middleware pipeline
+    auth_user = None  # the identity authenticated for this connection
+    send_queue = None
+    _send_queue_checked = False
+
+    @asyncio.coroutine
+    def bind_pipeline(self, pipeline, *, query=None):
+        """ instantiate the middlewares of a compiled pipeline for this
+        connection, replacing any that are already bound, and run their
+        `on_open` hooks. raises `ConnectionRefused` if a hook refuses the
+        connection.
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+        self.pipeline = pipeline.bind(self)
+        yield from self.pipeline.open(query=query)
+        return self.pipeline
+
+    def _bound_pipeline(self):
+        if self.pipeline is None:
+            self.pipeline = get_app().pipeline.bind(self)
+        return self.pipeline
+
+    def connection_lost(self, exc):
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.send_queue is not None:
+            self.send_queue.close()
+        super().connection_lost(exc)
+
+    def queue_stats(self):
+        """ the depth and drop counts of the send queue, None if frames are
+        written directly.
+        """
+        if self.send_queue is None:
+            return None
+        return self.send_queue.stats()
+
+    def _make_send_queue(self):
+        self._send_queue_checked = True
+        maxsize = settings.get("send_queue_size")
+        if maxsize:
+            self.send_queue = SendQueue(
+                self.send_frame,
+                maxsize=maxsize,
+                policy=settings.get("send_queue_policy", "block"),
+                on_overflow=self._on_overflow
+                )
+        return self.send_queue
+
+    def _on_overflow(self):
+        ensure_future(self.close(code=1008, reason="slow consumer"))
+
+    @asyncio.coroutine
+    def close(self, code=1000, reason=""):
+        """ flush the send queue, then close the connection. frames still
+        queued when the timeout runs out are dropped.
+        """
+        queue = self.send_queue
+        if queue is not None and not queue.closed:
+            timeout = settings.get("send_queue_close_timeout")
+            try:
+                yield from asyncio.wait_for(queue.join(),
+                    5 if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                pass
+            queue.close()
+        yield from super().close(code=code, reason=reason)
+
+    @asyncio.coroutine
+    def send_frame(self, data):
+        """ write a frame straight to the transport.
+        """
+        yield from super().send(data)
+
     @asyncio.coroutine
     def recv(self):
         message = yield from super().recv()
         if message:
-            app = get_app()
-            message = yield from app.run_middlewares(message, on="recv")
+            pipeline = self._bound_pipeline()
+            if pipeline.async_recv:
+                message = yield from pipeline.recv(message)
+            else:
+                message = pipeline.recv_sync(message)
             return message
 
     @asyncio.coroutine
     def send(self, message):
-        app = get_app()
-        data = yield from app.run_middlewares(message, on="send")
-        yield from super().send(data)
+        pipeline = self._bound_pipeline()
+        if pipeline.async_send:
+            data = yield from pipeline.send(message)
+        else:
+            data = pipeline.send_sync(message)
+        yield from self.send_encoded(data)
+
+    @asyncio.coroutine
+    def encode(self, message):
+        """ run the send pipeline without sending, returning the frame data.
+        """
+        pipeline = self._bound_pipeline()
+        if pipeline.async_send:
+            data = yield from pipeline.send(message)
+        else:
+            data = pipeline.send_sync(message)
+        return data
+
+    @asyncio.coroutine
+    def send_encoded(self, data):
+        """ send data that has already been through the send pipeline.
+        """
+        queue = self.send_queue
+        if queue is None and not self._send_queue_checked:
+            queue = self._make_send_queue()
+        if queue is None:
+            yield from super().send(data)
+        else:
+            yield from queue.put(data)
+
+
+@asyncio.coroutine
+def broadcast(websockets, message):
+    """ send a message to many websockets, running the send pipeline once for
+    each distinct pipeline rather than once per websocket and writing the
+    frames concurrently. returns the websockets that were closed or could not
+    be written to.
+    """
+    closed, groups = [], {}
+    for ws in websockets:
+        if not ws.open:
+            closed.append(ws)
+            continue
+        pipeline = ws.pipeline.pipeline if ws.pipeline is not None else None
+        groups.setdefault(pipeline, []).append(ws)
+
+    writes, targets = [], []
+    for group in groups.values():
+        data = yield from group[0].encode(message)
+        writes.extend(ws.send_encoded(data) for ws in group)
+        targets.extend(group)
+
+    if writes:
+        results = yield from asyncio.gather(*writes, return_exceptions=True)
+        for ws, result in zip(targets, results):
+            if isinstance(result, Exception):
+                closed.append(ws)
+    return closed
@@ -0,0 +1,168 @@
+"""
+.. module:: yawf.queues
+
+bounded outbound queues. each connection can write through a queue drained by
+its own writer task, so a slow reader only ever holds up itself. what happens
+when the queue is full is decided by its policy:
+
+- `block`: the sender waits for room in the queue
+- `drop_oldest`: the oldest queued frame is dropped to make room
+- `drop_newest`: the frame being sent is dropped
+- `disconnect`: the frame is dropped and the connection is closed
+"""
+import asyncio
+import collections
+
+from .compatibility import ensure_future
+
+__all__ = ("SendQueue", "POLICIES")
+
+
+POLICIES = ("block", "drop_oldest", "drop_newest", "disconnect")
+
+
+class SendQueue:
+    """ a bounded queue of frames written by a dedicated writer task.
+
+    .. code-block:: python
+
+        queue = SendQueue(websocket.send_frame, maxsize=64, policy="drop_oldest")
+        yield from queue.put(data)
+    """
+    # totals over every queue in the process
+    totals = {"sent": 0, "dropped": 0, "disconnected": 0}
+
+    def __init__(self, write, *, maxsize=64, policy="block", on_overflow=None,
+                 loop=None):
+        if policy not in POLICIES:
+            raise ValueError("unknown send queue policy {0}, choose one of"
+                " {1}".format(policy, POLICIES))
+        self.write = write
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_overflow = on_overflow
+        self.sent = self.dropped = self.max_depth = 0
+        self.closed = False
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._frames = collections.deque()
+        self._putters = collections.deque()
+        self._joiners = []
+        self._getter = None
+        self._writer = None
+        self._writing = False
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def stats(self):
+        return {
+            "depth": len(self._frames),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            }
+
+    @asyncio.coroutine
+    def put(self, data):
+        """ queue a frame, returning False if it was dropped.
+        """
+        while not self.closed and len(self._frames) >= self.maxsize:
+            if self.policy == "block":
+                waiter = asyncio.Future(loop=self._loop)
+                self._putters.append(waiter)
+                yield from waiter
+                continue
+            self._drop()
+            if self.policy == "drop_oldest":
+                self._frames.popleft()
+                break
+            if self.policy == "disconnect":
+                type(self).totals["disconnected"] += 1
+                self.close()
+                if self.on_overflow is not None:
+                    self.on_overflow()
+            return False
+
+        if self.closed:
+            return False
+        self._frames.append(data)
+        self.max_depth = max(self.max_depth, len(self._frames))
+        if self._writer is None:
+            self._writer = ensure_future(self._drain(), loop=self._loop)
+        self._wake(self._getter)
+        return True
+
+    @asyncio.coroutine
+    def join(self):
+        """ wait until every queued frame has been written, or the queue has
+        been closed.
+        """
+        while not self.closed and (self._frames or self._writing):
+            waiter = asyncio.Future(loop=self._loop)
+            self._joiners.append(waiter)
+            yield from waiter
+
+    def close(self):
+        """ stop the writer, dropping any queued frames and releasing blocked
+        senders.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        dropped = len(self._frames) + (1 if self._writing else 0)
+        if dropped:
+            self._drop(dropped)  # queued and mid-write frames are lost
+            self._frames.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+        self._wake(self._getter)
+        while self._putters:
+            self._wake(self._putters.popleft())
+        self._wake_joiners()
+
+    def _drop(self, count=1):
+        self.dropped += count
+        type(self).totals["dropped"] += count
+
+    def _wake_joiners(self):
+        joiners, self._joiners = self._joiners, []
+        for waiter in joiners:
+            self._wake(waiter)
+
+    @staticmethod
+    def _wake(waiter):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    @asyncio.coroutine
+    def _drain(self):
+        while not self.closed:
+            if not self._frames:
+                self._getter = asyncio.Future(loop=self._loop)
+                yield from self._getter
+                self._getter = None
+                continue
+            data = self._frames.popleft()
+            if self._putters:
+                self._wake(self._putters.popleft())
+            self._writing = True
+            try:
+                yield from self.write(data)
+            except asyncio.CancelledError:
+                raise  # closed mid-write, `close` counted the frame
+            except Exception:
+                self._writing = False
+                self._drop()
+                self.close()
+                return
+            self._writing = False
+            self.sent += 1
+            type(self).totals["sent"] += 1
+            if not self._frames:
+                self._wake_joiners()
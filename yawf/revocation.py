@@ -0,0 +1,130 @@
+"""
+.. module:: yawf.revocation
+
+a compact set of revoked token ids (the `jti` claim). ids are reduced to 64 bit
+keys kept in a sorted array, in front of which sits a bloom filter, so checking
+a token that was never revoked costs a hash and a few bit tests and millions of
+ids cost eight bytes each rather than a dict entry.
+"""
+import array
+import bisect
+import hashlib
+import heapq
+import math
+
+__all__ = ("BloomFilter", "RevocationList")
+
+
+def _key(token_id):
+    if isinstance(token_id, str):
+        token_id = token_id.encode("utf-8")
+    return int.from_bytes(hashlib.sha256(token_id).digest()[:8], "little")
+
+
+class BloomFilter:
+    """ a bloom filter over 64 bit keys, using double hashing of the two
+    halves of the key to pick its bits.
+    """
+    __slots__ = ("capacity", "size", "hashes", "bits")
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.capacity = capacity
+        self.size = size
+        self.hashes = max(1, round(size / capacity * math.log(2)))
+        self.bits = bytearray((size + 7) // 8)
+
+    def _positions(self, key):
+        low, high = key & 0xffffffff, (key >> 32) | 1
+        for i in range(self.hashes):
+            yield (low + i * high) % self.size
+
+    def add(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """ the ids of revoked tokens.
+
+    .. code-block:: python
+
+        revoked = RevocationList()
+        revoked.load("/var/lib/myapp/revoked.txt")  # one jti per line
+        revoked.add("4f1c...")
+        "4f1c..." in revoked  # True
+    """
+    __slots__ = ("error_rate", "_keys", "_bloom")
+
+    def __init__(self, capacity=1024, error_rate=0.001):
+        self.error_rate = error_rate
+        self._keys = array.array("Q")
+        self._bloom = BloomFilter(capacity, error_rate)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, token_id):
+        if not self._keys:
+            return False
+        key = _key(token_id)
+        if key not in self._bloom:
+            return False
+        index = bisect.bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index] == key
+
+    def add(self, token_id):
+        key = _key(token_id)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return
+        self._keys.insert(index, key)
+        if len(self._keys) > self._bloom.capacity:
+            self._rebuild(len(self._keys) * 2)
+        else:
+            self._bloom.add(key)
+
+    def load(self, path, *, chunk_size=65536):
+        """ add every id in a file with one id per line, in bulk. ids are read
+        into sorted arrays of `chunk_size` keys which are then merged, so only
+        one chunk is ever held as python objects.
+        """
+        runs = [self._keys] if self._keys else []
+        chunk = []
+        with open(path) as ids:
+            for line in ids:
+                line = line.strip()
+                if line:
+                    chunk.append(_key(line))
+                    if len(chunk) >= chunk_size:
+                        runs.append(array.array("Q", sorted(chunk)))
+                        chunk = []
+        if chunk:
+            runs.append(array.array("Q", sorted(chunk)))
+
+        keys, last = array.array("Q"), None
+        for key in heapq.merge(*runs):
+            if key != last:
+                keys.append(key)
+                last = key
+        self._keys = keys
+        self._rebuild(max(len(self._keys), self._bloom.capacity))
+        return len(self._keys)
+
+    def clear(self):
+        self._keys = array.array("Q")
+        self._rebuild(self._bloom.capacity)
+
+    def _rebuild(self, capacity):
+        self._bloom = BloomFilter(capacity, self.error_rate)
+        for key in self._keys:
+            self._bloom.add(key)
@@ -1,7 +1,7 @@
 import asyncio
 import collections
-import functools as ft
 import re
+import uuid
 
 from .base import BaseHandler
 
@@ -17,6 +17,168 @@ class RouterResolutionError(Exception):
     """
 
 
+class Converter:
+    """ a named path group type, `{pk:int}`. the regex validates the path part
+    and `to_python` converts the matched string, raising a `ValueError` if the
+    part should not match after all.
+    """
+    regex = r"[\w_]+"
+
+    def to_python(self, value):
+        return value
+
+
+class IntConverter(Converter):
+    regex = r"[0-9]+"
+
+    def to_python(self, value):
+        return int(value)
+
+
+class UUIDConverter(Converter):
+    regex = r"[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}"
+
+    def to_python(self, value):
+        return uuid.UUID(value)
+
+
+class SlugConverter(Converter):
+    regex = r"[-a-zA-Z0-9_]+"
+
+
+class PathConverter(Converter):
+    regex = r".+"
+
+
+# `path` is the route's path description, with the prefixes of the routers it
+# is mounted under. connections to lower `priority` routes are shed first
+Route = collections.namedtuple(
+    "Route", ("path", "handler", "middleware", "priority"))
+
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ("hits", "misses", "evictions", "maxsize", "currsize"))
+
+
+class ResolutionCache:
+    """ a bounded lru cache of resolved paths. paths that could not be resolved
+    are remembered separately, in a bound of their own, so that probing random
+    paths cannot push out the routes that are actually in use.
+    """
+    __slots__ = ("maxsize", "miss_maxsize", "hits", "misses", "evictions",
+                 "_found", "_missing")
+
+    def __init__(self, maxsize=128, miss_maxsize=128):
+        self.maxsize = maxsize
+        self.miss_maxsize = miss_maxsize
+        self._found = collections.OrderedDict()
+        self._missing = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._found) + len(self._missing)
+
+    def get(self, path):
+        """ return `(True, value)` for a resolved path, `(False, message)` for
+        a path known not to resolve and `None` if the path is not cached.
+        """
+        if path in self._found:
+            self._found.move_to_end(path)
+            self.hits += 1
+            return True, self._found[path]
+        if path in self._missing:
+            self._missing.move_to_end(path)
+            self.hits += 1
+            return False, self._missing[path]
+        self.misses += 1
+        return None
+
+    def put(self, path, value):
+        self._put(self._found, self.maxsize, path, value)
+
+    def put_missing(self, path, message):
+        self._put(self._missing, self.miss_maxsize, path, message)
+
+    def _put(self, entries, maxsize, path, value):
+        if not maxsize:
+            return
+        entries[path] = value
+        if len(entries) > maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._found.clear()
+        self._missing.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.maxsize + self.miss_maxsize, len(self))
+
+
+class _Node:
+    """ a single level of the routing tree. static segments are looked up in a
+    dict, dynamic segments are tried in the order they were added.
+    """
+    __slots__ = ("static", "dynamic", "route", "order")
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = []   # [(name, regex, greedy, converter, node), ...]
+        self.route = None   # (order, route) of the route ending here
+        self.order = None   # lowest registration order in this subtree
+
+    def child(self, part, regex=None, converter=None):
+        """ return the child node for a static part or a dynamic group,
+        creating it if it does not exist.
+        """
+        if regex is None:
+            return self.static.setdefault(part, _Node())
+
+        for name, _regex, _, _converter, node in self.dynamic:
+            if (name == part and _regex.pattern == regex.pattern and
+                    _converter is converter):
+                return node
+        node = _Node()
+        # a group whose pattern can match a slash may span several segments
+        greedy = regex.search("/") is not None
+        self.dynamic.append((part, regex, greedy, converter, node))
+        return node
+
+    def match(self, parts, index, kwargs, best):
+        """ walk the tree depth first, keeping the earliest registered route
+        in `best`. subtrees that can only hold later routes are skipped.
+        """
+        if best and self.order >= best[0]:
+            return best
+
+        if index == len(parts):
+            if self.route is not None and (not best or self.route[0] < best[0]):
+                order, route = self.route
+                best = order, route, dict(kwargs)
+            return best
+
+        node = self.static.get(parts[index])
+        if node is not None:
+            best = node.match(parts, index + 1, kwargs, best)
+
+        for name, regex, greedy, converter, node in self.dynamic:
+            stop = len(parts) if greedy else index + 1
+            for end in range(stop, index, -1):
+                value = "/".join(parts[index:end])
+                if regex.match(value) is None:
+                    continue
+                if converter is not None:
+                    try:
+                        value = converter.to_python(value)
+                    except ValueError:
+                        continue
+                kwargs[name] = value
+                best = node.match(parts, end, kwargs, best)
+                del kwargs[name]
+        return best
+
+
 class Router:
     """ a router for a websocket application
     """
@@ -29,39 +191,147 @@ class Router:
         \}                              # group closing character
         """, re.VERBOSE)
 
-    __slots__ = ("routes",)
+    default_pattern = r"[\w_]+"
+    converters = {
+        "int": IntConverter(),
+        "uuid": UUIDConverter(),
+        "slug": SlugConverter(),
+        "path": PathConverter(),
+        }
 
-    def __init__(self):
+    __slots__ = ("routes", "mounts", "middleware", "cache", "prefix",
+                 "_stacks", "_priorities", "_tree", "_static")
+
+    def __init__(self, *, middleware=None, cache_size=128, miss_cache_size=128):
         self.routes = collections.OrderedDict()
+        self.mounts = {}
+        self.middleware = middleware
+        self.prefix = ""  # the path this router is mounted under
+        self._stacks = {}
+        self._priorities = {}
+        self.cache = ResolutionCache(cache_size, miss_cache_size)
+        self._tree = None
+        self._static = None
 
     def __str__(self):
         return "{0}({1})".format(self.__class__.__name__, str(list(self.routes.keys())))
     __repr__ = __str__
 
-    def route(self, path_desc):
-        """ wrap a handler in a route
+    def route(self, path_desc, *, middleware=None, priority=None):
+        """ wrap a handler in a route. `middleware` is a list of middleware
+        import paths used for this route instead of `settings.middleware`, it
+        defaults to the handler's `middleware` attribute and then to the
+        router's own `middleware`. `priority` defaults to the handler's
+        `priority` attribute, and then to 0.
         """
         def wrap(handler):
-            if issubclass(handler, BaseHandler):
+            stack, rank = middleware, priority
+            if rank is None:
+                rank = getattr(handler, "priority", 0)
+            if isinstance(handler, type) and issubclass(handler, BaseHandler):
+                if stack is None:
+                    stack = handler.middleware
                 handler = handler.as_handler()
             regex = self._make_regex(self.clean_path(path_desc))
             self.routes[path_desc] = regex, handler
+            self._stacks[path_desc] = stack
+            self._priorities[path_desc] = rank
+            self._tree = self._static = None  # rebuilt on the next resolution
+            self.cache.clear()
             return handler
         return wrap
 
-    @ft.lru_cache(maxsize=100)
+    def mount(self, prefix, router):
+        """ mount another router under a single static path segment. paths
+        starting with that segment are resolved by the mounted router alone,
+        with the prefix stripped, using its own resolution cache.
+
+        ::
+
+            chat = Router()
+
+            @chat.route("/rooms/{room_id:int}")
+            @asyncio.coroutine
+            def room(ws, **kwargs):
+                pass
+
+            urls = Router()
+            urls.mount("/chat", chat)  # resolves /chat/rooms/1
+        """
+        parts = self.clean_path(prefix)
+        match = self.path_desc_syntax.match(parts[0])
+        if len(parts) != 1 or match is None or match.group() != parts[0]:
+            raise RouterSyntaxError("a router can only be mounted on a single"
+                " static path segment, not {}".format(prefix))
+        self.mounts[parts[0]] = router
+        router._set_prefix("{0}/{1}".format(self.prefix, parts[0]))
+        return router
+
+    def _set_prefix(self, prefix):
+        self.prefix = prefix
+        self._tree = self._static = None  # route paths include the prefix
+        self.cache.clear()
+        for segment, router in self.mounts.items():
+            router._set_prefix("{0}/{1}".format(prefix, segment))
+
     def resolve(self, path):
         """ resolve the path, returning the keywords dict and its handler.
         """
-        for regex, handler in self.routes.values():
-            match = regex.match(path)
-            if match is not None:
-                return match.groupdict(), handler
-        raise RouterResolutionError("could not resolve the path {0}"
-            " tried {1}".format(path, list(self.routes.keys())))
+        kwargs, route = self.lookup(path)
+        return kwargs, route.handler
+
+    def lookup(self, path):
+        """ resolve the path, returning the keywords dict and the `Route` it
+        matched.
+        """
+        if self.mounts and path.startswith("/"):
+            segment, _, rest = path[1:].partition("/")
+            router = self.mounts.get(segment)
+            if router is not None:
+                return router.lookup("/" + rest)
+
+        cached = self.cache.get(path)
+        if cached is None:
+            match = self._match(path)
+            if match is None:
+                # just the path, misses are often scanners trying random paths
+                message = "could not resolve the path {0}{1}".format(
+                    self.prefix, path)
+                self.cache.put_missing(path, message)
+                raise RouterResolutionError(message)
+            self.cache.put(path, match)
+            cached = True, match
+
+        found, value = cached
+        if not found:
+            raise RouterResolutionError(value)
+        kwargs, route = value
+        return dict(kwargs), route
 
     __call__ = resolve
 
+    def stacks(self):
+        """ return the distinct middleware stacks used by this router's routes
+        and by its mounted routers, None being `settings.middleware`.
+        """
+        stacks = set()
+        for path_desc in self.routes:
+            stack = self._stacks.get(path_desc)
+            if stack is None:
+                stack = self.middleware
+            stacks.add(None if stack is None else tuple(stack))
+        for router in self.mounts.values():
+            stacks.update(router.stacks())
+        return stacks
+
+    def cache_info(self):
+        """ return the hits, misses and evictions of the resolution cache.
+        """
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
     def clean_path(self, path):
         """ add some path components into the path description, the resulting
         desc will look like this '^/...pathstuff.../?$', the trailing slash is
@@ -72,6 +342,120 @@ class Router:
         parts = stripped.split("/")
         return parts
 
+    def split_path(self, path):
+        """ split a requested path into the parts matched by the routing tree,
+        a single trailing slash is optional.
+        """
+        if not path.startswith("/"):
+            return None
+        path = path[1:]
+        if path.endswith("/") and path != "/":
+            path = path[:-1]
+        return path.split("/")
+
+    def freeze(self):
+        """ compile the registered routes. static routes go into an exact match
+        table keyed by their path, with and without the trailing slash, and only
+        dynamic routes are left to the routing tree. routes added after freezing
+        cause the tables to be rebuilt on the next resolution. mounted routers
+        are frozen too.
+        """
+        for router in self.mounts.values():
+            router.freeze()
+        routes = []
+        for order, (path_desc, (_, handler)) in enumerate(self.routes.items()):
+            parts = self.clean_path(path_desc)
+            static = not any(self.path_group_syntax.match(p) for p in parts)
+            stack = self._stacks.get(path_desc)
+            if stack is None:
+                stack = self.middleware
+            path = path_desc
+            if self.prefix:
+                path = "{0}/{1}".format(self.prefix, path_desc.lstrip("/"))
+            route = Route(path, handler,
+                          None if stack is None else tuple(stack),
+                          self._priorities.get(path_desc, 0))
+            routes.append((order, parts, route, static))
+
+        tree = self._build_tree(routes)
+        dynamic = self._build_tree([r for r in routes if not r[3]])
+        table = {}
+        for _, parts, _, static in routes:
+            if not static:
+                continue
+            # an earlier dynamic route may shadow this one, so ask the full tree
+            _, route, kwargs = tree.match(parts, 0, {}, None)
+            path = "/" + "/".join(parts)
+            table.setdefault(path, (kwargs, route))
+            if any(parts):
+                table.setdefault(path + "/", (kwargs, route))
+
+        self._tree, self._static = dynamic, table
+        return self
+
+    def _build_tree(self, routes):
+        """ build a routing tree from `(order, parts, route, static)` tuples,
+        the order of a route is its priority.
+        """
+        root = _Node()
+        for order, parts, route, _ in routes:
+            node = root
+            nodes = [node]
+            for part in parts:
+                match = self.path_group_syntax.match(part)
+                if match is None:
+                    node = node.child(part)
+                else:
+                    name, pattern = match.group("name", "pattern")
+                    pattern, converter = self._group_pattern(pattern)
+                    regex = re.compile(r"(?:{})\Z".format(pattern))
+                    node = node.child(name, regex, converter)
+                nodes.append(node)
+            if node.route is None:
+                node.route = order, route
+            for node in nodes:
+                if node.order is None:
+                    node.order = order
+        if root.order is None:
+            root.order = len(routes)
+        return root
+
+    def _match(self, path):
+        """ match the path against the static table and the routing tree,
+        returning the keywords dict and `Route` of the first registered route
+        that matches.
+        """
+        if self._static is None:
+            self.freeze()
+        static = self._static.get(path)
+        if static is not None:
+            return static
+
+        parts = self.split_path(path)
+        if parts is None:
+            return None
+        best = self._tree.match(parts, 0, {}, None)
+        if best is not None:
+            _, route, kwargs = best
+            return kwargs, route
+        return None
+
+    @classmethod
+    def register_converter(cls, name, converter):
+        """ make `{group:name}` match and convert path parts with `converter`.
+        """
+        cls.converters = dict(cls.converters, **{name: converter})
+
+    def _group_pattern(self, pattern):
+        """ return the regex and the converter, if any, for a group's pattern.
+        """
+        if pattern is None:
+            return self.default_pattern, None
+        converter = self.converters.get(pattern)
+        if converter is not None:
+            return converter.regex, converter
+        return pattern, None
+
     def _check(self, parts):
         if self.path_group_syntax.match(parts[0]):
             raise RouterSyntaxError("the path description has a dynamic"
@@ -97,7 +481,7 @@ class Router:
             match = self.path_group_syntax.match(part)
             if match is not None:
                 groups = match.groupdict()
-                groups["pattern"] = groups["pattern"] or "[\w_]+"
+                groups["pattern"], _ = self._group_pattern(groups["pattern"])
                 part = "(?P<{name}>{pattern})".format(**groups)
             parts.append(part)
 
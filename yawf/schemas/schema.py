@@ -5,7 +5,7 @@ about your websocket api.
 import datetime
 
 from yawf.utils import Frozen
-from yawf.compatibility import yayson
+from yawf.serializers import get_serializer
 
 from . import fields
 
@@ -81,9 +81,9 @@ class MessageSchema(metaclass=MessageSchemaMeta):
     @classmethod
     def dumps(cls, message):
         serialized = message.dump_dict()
-        return yayson.dumps(serialized)
+        return get_serializer().dumps(serialized)
 
     @classmethod
     def loads(cls, message):
-        loaded = yayson.loads(message)
+        loaded = get_serializer().loads(message)
         return cls(**loaded)
@@ -0,0 +1,107 @@
+"""
+.. module:: yawf.serializers
+
+the serializer used for messages is picked by name with `settings.serializer`,
+`"auto"` (the default) uses ujson if it is installed and the standard library
+json module otherwise.
+
+every backend sends datetimes as UTC ISO 8601 strings, except that orjson
+leaves out the fraction of a second when it is zero. dates and UUIDs are sent
+as strings and values of any other unknown type as null.
+
+.. code-block:: python
+    :caption: settings.py
+
+    s.serializer = "orjson"
+"""
+import collections
+import functools as ft
+import datetime
+import uuid
+
+from yawf.conf import settings
+
+__all__ = ("Serializer", "register_serializer", "get_serializer")
+
+
+Serializer = collections.namedtuple("Serializer", ("name", "dumps", "loads"))
+
+_factories = collections.OrderedDict()
+_serializers = {}
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        return "%04d-%02d-%02dT%02d:%02d:%02d.%06dZ" % (
+            obj.year, obj.month, obj.day,
+            obj.hour, obj.minute, obj.second, obj.microsecond)
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    elif isinstance(obj, bytes):
+        return obj.decode("utf-8")
+    elif isinstance(obj, uuid.UUID):
+        return str(obj)
+    # anything else is sent as null, as it always has been
+
+
+def register_serializer(name, factory):
+    """ register a function returning a `Serializer`, it is called the first
+    time the serializer is asked for and may raise an ImportError if its
+    library is not installed.
+    """
+    _factories[name] = factory
+    _serializers.pop(name, None)
+
+
+def get_serializer(name=None):
+    """ return the serializer registered as `name`, or the one chosen with
+    `settings.serializer`.
+    """
+    if name is None:
+        name = settings.get("serializer") or "auto"
+    serializer = _serializers.get(name)
+    if serializer is None:
+        try:
+            factory = _factories[name]
+        except KeyError:
+            raise ValueError("unknown serializer {0}, choose one of"
+                " {1}".format(name, list(_factories.keys())))
+        serializer = _serializers[name] = factory()
+    return serializer
+
+
+def _json():
+    import json
+    return Serializer("json", ft.partial(json.dumps, default=_default),
+                      json.loads)
+
+
+def _ujson():
+    import ujson
+    return Serializer("ujson", ft.partial(ujson.dumps, default=_default),
+                      ujson.loads)
+
+
+def _orjson():
+    import orjson
+
+    # naive datetimes are taken as UTC, like `_default` does for the others
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=option)\
+            .decode("utf-8")
+    return Serializer("orjson", dumps, orjson.loads)
+
+
+def _auto():
+    try:
+        return _ujson()
+    except ImportError:
+        return _json()
+
+
+register_serializer("auto", _auto)
+register_serializer("json", _json)
+register_serializer("ujson", _ujson)
+register_serializer("orjson", _orjson)
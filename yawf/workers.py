@@ -0,0 +1,159 @@
+"""
+.. module:: yawf.workers
+
+pre-forked worker processes. the listening socket is bound once in the
+supervising process and inherited by each worker, which runs its own event
+loop and accepts connections from the shared socket.
+
+.. code-block:: python
+
+    app.run("0.0.0.0", 8765, workers=4)
+
+the supervisor restarts workers that crash. workers run in process groups of
+their own, so a Ctrl-C in the terminal only reaches the supervisor, which
+sends each worker a single `SIGTERM` on `SIGINT` or `SIGTERM` so that they can
+drain before it exits.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+import traceback
+
+__all__ = ("Supervisor", "bind_socket")
+
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host, port, *, backlog=100, reuse_port=False):
+    """ bind a listening tcp socket to share between worker processes.
+    """
+    family, type_, proto, _, address = socket.getaddrinfo(
+        host, int(port), type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)[0]
+    sock = socket.socket(family, type_, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class Supervisor:
+    """ forks a process for each target and waits on them, restarting a
+    target whose process exits with an error until the supervisor is stopped.
+    a target that exits cleanly is not restarted.
+
+    .. code-block:: python
+
+        supervisor = Supervisor([serve_forever] * 4)
+        supervisor.run()  # returns once every worker has exited
+    """
+    signals = (signal.SIGINT, signal.SIGTERM)
+    restart_delay = 1.0  # wait this long before restarting a worker that
+    min_uptime = 1.0     # crashed within `min_uptime` seconds of starting
+
+    def __init__(self, targets, *, restart_delay=None):
+        self.targets = list(targets)
+        self.children = {}  # pid -> (index, start time)
+        self.stopping = False
+        self.restarts = 0
+        if restart_delay is not None:
+            self.restart_delay = restart_delay
+
+    def __str__(self):
+        return "<{0} :: Workers={1}>".format(
+            self.__class__.__name__, len(self.children))
+    __repr__ = __str__
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            self._run_child(self.targets[index])
+        try:
+            os.setpgid(pid, pid)  # also done by the child, whichever is first
+        except OSError:  # pragma: no cover
+            pass
+        self.children[pid] = (index, time.monotonic())
+        return pid
+
+    def _run_child(self, target):  # pragma: no cover
+        try:
+            os.setpgid(0, 0)
+        except OSError:
+            pass
+        for signum in self.signals:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        code = 0
+        try:
+            target()
+        except SystemExit as err:
+            code = err.code if isinstance(err.code, int) else 1
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, signum=None, frame=None):
+        """ stop restarting workers and send them `SIGTERM`, whichever signal
+        stopped the supervisor.
+        """
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def handoff(self):
+        """ stop restarting workers and tell them their listening socket has
+        been handed off, so that they stagger closing their connections.
+        """
+        from .handoff import HANDOFF_SIGNAL
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, HANDOFF_SIGNAL)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        previous = {s: signal.signal(s, self.stop) for s in self.signals}
+        try:
+            for index in range(len(self.targets)):
+                self.spawn(index)
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except InterruptedError:  # pragma: no cover
+                    continue
+                except ChildProcessError:  # pragma: no cover
+                    break
+                self._reap(pid, status)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def _reap(self, pid, status):
+        child = self.children.pop(pid, None)
+        if child is None:
+            return
+        index, started = child
+        crashed = not (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0)
+        if self.stopping or not crashed:
+            return
+        logger.warning("worker {0} (pid {1}) died with status {2},"
+            " restarting".format(index, pid, status))
+        if time.monotonic() - started < self.min_uptime:
+            time.sleep(self.restart_delay)
+            if self.stopping:
+                return
+        self.restarts += 1
+        self.spawn(index)